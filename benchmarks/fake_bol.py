@@ -0,0 +1,226 @@
+import base64
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sync import constants
+
+DETAIL_PATH = re.compile(r"^/retailer/shipments/(\d+)$")
+LIST_PATH = "/retailer/shipments/"
+TOKEN_PATH = "/token"
+
+
+class RateLimitWindow:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.started_at = time.monotonic()
+        self.used = 0
+
+    def take(self):
+        """Returns (allowed, remaining, reset seconds) for one request."""
+        elapsed = time.monotonic() - self.started_at
+        if elapsed >= self.window:
+            self.started_at, self.used, elapsed = time.monotonic(), 0, 0
+
+        reset = max(int(self.window - elapsed), 1)
+        if self.used >= self.limit:
+            return False, 0, reset
+
+        self.used += 1
+        return True, self.limit - self.used, reset
+
+
+class FakeBol:
+    """
+    Local stand-in for the bol.com token, shipments list & shipment detail end points.
+
+    Every seller is registered with its access token and the number of shipments bol.com
+    knows about, shipments alternate between FBR & FBB and are listed newest first.
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=8765, latency=0.0, page_size=50, list_limit=7, detail_limit=14, window=60
+    ):
+        self.latency = latency
+        self.page_size = page_size
+        self.limits = {
+            constants.SHIPMENT_LIST_ENDPOINT_NAME: list_limit,
+            constants.SHIPMENT_DETAIL_ENDPOINT_NAME: detail_limit,
+        }
+        self.window = window
+        self.catalogues = {}
+        self.credentials = {}
+        self.windows = {}
+        self.calls = dict.fromkeys(["token", *self.limits], 0)
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return "http://%s:%s" % self.server.server_address
+
+    def add_seller(self, client_id, access_token, shipment_ids):
+        shipment_ids = sorted(shipment_ids, reverse=True)
+        self.credentials[client_id] = access_token
+        self.catalogues[access_token] = {
+            constants.FBR: shipment_ids[0::2],
+            constants.FBB: shipment_ids[1::2],
+        }
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def take(self, access_token, end_point_name):
+        with self.lock:
+            self.calls[end_point_name] += 1
+            key = (access_token, end_point_name)
+            if key not in self.windows:
+                self.windows[key] = RateLimitWindow(self.limits[end_point_name], self.window)
+            allowed, remaining, reset = self.windows[key].take()
+            if not allowed:
+                self.throttled += 1
+            return allowed, remaining, reset
+
+    def shipment_list(self, access_token, page, method):
+        start = (page - 1) * self.page_size
+        shipment_ids = self.catalogues[access_token][method][start : start + self.page_size]
+        return {"shipments": [self.shipment_summary(shipment_id) for shipment_id in shipment_ids]}
+
+    def shipment_summary(self, shipment_id):
+        return {
+            "shipmentId": shipment_id,
+            "shipmentDate": self.shipment_date(shipment_id),
+            "shipmentReference": "",
+            "shipmentItems": [],
+            "transport": {"transportId": shipment_id},
+        }
+
+    def shipment_date(self, shipment_id):
+        return (datetime(2020, 1, 1) + timedelta(minutes=shipment_id % 500000)).isoformat() + "+01:00"
+
+    def shipment_detail(self, shipment_id):
+        shipment_date = self.shipment_date(shipment_id)
+        return {
+            "shipmentId": shipment_id,
+            "pickUpPoint": False,
+            "shipmentDate": shipment_date,
+            "shipmentReference": "",
+            "shipmentItems": [
+                {
+                    "orderItemId": str(shipment_id),
+                    "orderId": "O%s" % shipment_id,
+                    "orderDate": shipment_date,
+                    "latestDeliveryDate": shipment_date,
+                    "ean": "87%011d" % (shipment_id % 100),
+                    "title": "Benchmark product %s" % (shipment_id % 100),
+                    "quantity": 1,
+                    "offerPrice": "12.95",
+                    "offerCondition": "NEW",
+                    "offerReference": "",
+                    "fulfilmentMethod": constants.FBR,
+                }
+            ],
+            "transport": {
+                "transportId": shipment_id,
+                "transporterCode": "TNT",
+                "trackAndTrace": "3SBOL%s" % shipment_id,
+            },
+            "customerDetails": {
+                "salutationCode": "01",
+                "firstName": "Customer",
+                "surname": "%s" % (shipment_id % 1000),
+                "streetName": "Street",
+                "houseNumber": "1",
+                "zipCode": "1234AB",
+                "city": "Utrecht",
+                "countryCode": "NL",
+                "email": "customer%s@example.com" % (shipment_id % 1000),
+            },
+        }
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def respond(self, status, data=None, headers=None):
+                body = json.dumps(data).encode() if data is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def access_token(self):
+                token = self.headers.get("Authorization", "")[len("Bearer ") :]
+                return token if token in fake.catalogues else None
+
+            def do_POST(self):
+                time.sleep(fake.latency)
+                if urlparse(self.path).path != TOKEN_PATH:
+                    return self.respond(404)
+
+                with fake.lock:
+                    fake.calls["token"] += 1
+                client_id = decode_basic(self.headers.get("Authorization", "")).split(":")[0]
+                if client_id not in fake.credentials:
+                    return self.respond(401)
+                return self.respond(200, {"access_token": fake.credentials[client_id], "expires_in": 299})
+
+            def do_GET(self):
+                time.sleep(fake.latency)
+                url = urlparse(self.path)
+                access_token = self.access_token()
+                if access_token is None:
+                    return self.respond(401)
+
+                if url.path == LIST_PATH:
+                    end_point_name = constants.SHIPMENT_LIST_ENDPOINT_NAME
+                elif DETAIL_PATH.match(url.path):
+                    end_point_name = constants.SHIPMENT_DETAIL_ENDPOINT_NAME
+                else:
+                    return self.respond(404)
+
+                allowed, remaining, reset = fake.take(access_token, end_point_name)
+                headers = {
+                    "x-ratelimit-limit": fake.limits[end_point_name],
+                    "x-ratelimit-remaining": remaining,
+                    "x-ratelimit-reset": reset,
+                }
+                if not allowed:
+                    headers["retry-after"] = reset
+                    return self.respond(429, {"title": "Too Many Requests"}, headers)
+
+                if end_point_name == constants.SHIPMENT_LIST_ENDPOINT_NAME:
+                    query = parse_qs(url.query)
+                    page = int(query.get("page", ["1"])[0])
+                    method = query.get("fulfilment-method", [constants.FBR])[0]
+                    return self.respond(200, fake.shipment_list(access_token, page, method), headers)
+
+                shipment_id = int(DETAIL_PATH.match(url.path).group(1))
+                return self.respond(200, fake.shipment_detail(shipment_id), headers)
+
+        return Handler
+
+
+def decode_basic(header):
+    try:
+        return base64.b64decode(header[len("Basic ") :]).decode()
+    except ValueError:
+        return ""
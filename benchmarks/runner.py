@@ -0,0 +1,123 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from celery.signals import task_postrun, task_prerun
+from django.db import connection
+
+from boloo_shop import celery_app
+from shipments.models import Transport
+from sync import constants
+from sync.models import SellerEndPointTracker, ShipmentSyncTracker
+from sync.tasks import SyncEndPoints
+
+from .seed import benchmark_sellers, seed
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_task_queries(counter):
+    """Counts the queries of every task run by a worker of this process."""
+
+    def install(**kwargs):
+        connection.execute_wrappers.append(counter)
+
+    def uninstall(**kwargs):
+        if counter in connection.execute_wrappers:
+            connection.execute_wrappers.remove(counter)
+
+    task_prerun.connect(install, weak=False)
+    task_postrun.connect(uninstall, weak=False)
+    try:
+        yield counter
+    finally:
+        task_prerun.disconnect(install)
+        task_postrun.disconnect(uninstall)
+
+
+@contextmanager
+def local_worker(concurrency):
+    """
+    Runs a worker thread on an in-memory broker. Always eager mode is no use here, it
+    ignores the eta of rescheduled tasks & would hammer the stand-in after every 429.
+    """
+    from celery.contrib.testing.worker import start_worker
+
+    celery_app.conf.update(CELERY_BROKER_URL="memory://", CELERY_TASK_ALWAYS_EAGER=False)
+    with start_worker(
+        celery_app,
+        concurrency=concurrency,
+        pool="solo" if concurrency == 1 else "threads",
+        perform_ping_check=False,
+        shutdown_timeout=60,
+    ):
+        yield
+
+
+def sync_progress(sellers):
+    finished = ShipmentSyncTracker.objects.filter(
+        seller__in=sellers, state=ShipmentSyncTracker.FINISHED
+    ).count()
+    pending_scans = SellerEndPointTracker.objects.filter(
+        seller__in=sellers, end_point_name=constants.SHIPMENT_LIST_ENDPOINT_NAME
+    ).exclude(initial_fbr_completed=True, initial_fbb_completed=True)
+    return finished, pending_scans.exists()
+
+
+def run(
+    fake_bol, sellers, shipments_per_seller, mode="local", concurrency=1, tick=1.0, timeout=600, keep=False
+):
+    """
+    Syncs every seeded seller from the stand-in, kicking SyncEndPoints every tick like beat would,
+    and returns the measurements of the run.
+    """
+    seller_instances = seed(fake_bol, sellers, shipments_per_seller)
+    expected = sellers * shipments_per_seller
+    counter = QueryCounter()
+    worker = local_worker(concurrency) if mode == "local" else _nullcontext()
+
+    try:
+        with count_task_queries(counter), worker:
+            started = time.monotonic()
+            finished, scanning = 0, True
+            while time.monotonic() - started < timeout:
+                SyncEndPoints.delay()
+                time.sleep(tick)
+                finished, scanning = sync_progress(seller_instances)
+                if finished >= expected and not scanning:
+                    break
+            elapsed = time.monotonic() - started
+    finally:
+        if not keep:
+            Transport.objects.filter(transported_shipments__seller__in=benchmark_sellers()).delete()
+            benchmark_sellers().delete()
+
+    api_calls = sum(fake_bol.calls.values())
+    return {
+        "mode": mode,
+        "sellers": sellers,
+        "shipments": expected,
+        "synced": finished,
+        "fully_synced": finished >= expected and not scanning,
+        "seconds": elapsed,
+        "shipments_per_second": finished / elapsed if elapsed else 0,
+        "api_calls": dict(fake_bol.calls, throttled=fake_bol.throttled),
+        "api_calls_per_shipment": api_calls / finished if finished else None,
+        # queries are only visible for tasks run by this process.
+        "db_queries_per_shipment": counter.count / finished if finished and mode == "local" else None,
+    }
+
+
+@contextmanager
+def _nullcontext():
+    yield
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.utils.timezone import now
+
+from shipments.models import Seller
+from sync import constants
+from sync.models import SellerEndPointTracker
+
+CLIENT_ID_PREFIX = "benchmark-"
+
+
+def benchmark_sellers():
+    return Seller.objects.filter(client_id__startswith=CLIENT_ID_PREFIX)
+
+
+def seed(fake_bol, sellers, shipments_per_seller):
+    """Creates sellers with their end point trackers and registers their shipments with the stand-in."""
+    benchmark_sellers().delete()
+    seller_instances = []
+
+    for index in range(1, sellers + 1):
+        seller = Seller.objects.create(
+            name="Benchmark seller %s" % index,
+            client_id="%s%s" % (CLIENT_ID_PREFIX, index),
+            client_secret="secret",
+            access_token="benchmark-token-%s" % index,
+            token_expires_at=now() + timedelta(days=1),
+        )
+        for end_point_name, limit in constants.RATE_LIMITS.items():
+            SellerEndPointTracker.objects.create(
+                seller=seller, end_point_name=end_point_name, remaining_req_limit=limit, limit_reset_at=now(),
+            )
+
+        # shipment ids are unique across sellers, just like bol.com's.
+        first_id = index * 1000000
+        fake_bol.add_seller(
+            seller.client_id, seller.access_token, range(first_id, first_id + shipments_per_seller),
+        )
+        seller_instances.append(seller)
+
+    return seller_instances
@@ -0,0 +1,47 @@
+import os
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+_sessions = {}
+
+
+def session():
+    # Connection pools must not be shared with forked worker processes.
+    pid = os.getpid()
+    if pid not in _sessions:
+        _sessions.clear()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=settings.BOL_HTTP_POOL_SIZE)
+        instance = requests.Session()
+        instance.mount("https://", adapter)
+        instance.mount("http://", adapter)
+        _sessions[pid] = instance
+
+    return _sessions[pid]
+
+
+def request(method, url, token=None, headers=None, end_point_name="other", **kwargs):
+    headers = dict(headers or {})
+    if token is not None:
+        headers["Authorization"] = "Bearer %s" % token
+
+    kwargs.setdefault("timeout", (settings.BOL_HTTP_CONNECT_TIMEOUT, settings.BOL_HTTP_READ_TIMEOUT))
+    started_at = time.monotonic()
+    response = None
+    try:
+        response = session().request(method, url, headers=headers, **kwargs)
+        return response
+    finally:
+        metrics.observe_bol_request(end_point_name, started_at, response)
+
+
+def get(url, token=None, **kwargs):
+    return request("GET", url, token=token, **kwargs)
+
+
+def post(url, token=None, **kwargs):
+    return request("POST", url, token=token, **kwargs)
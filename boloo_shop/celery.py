@@ -14,6 +14,9 @@ app = Celery("boloo_shop")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
+# registers the task signal handlers exporting task metrics.
+from . import metrics  # noqa isort:skip
+
 
 @app.task(bind=True)
 def debug_task(self):
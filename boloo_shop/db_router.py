@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = "replica"
+# set on responses to requests which wrote, the session reads from the primary until it expires.
+READ_PRIMARY_COOKIE = "read_primary"
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_read_primary = ContextVar("read_primary", default=False)
+_wrote = ContextVar("wrote", default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Sends the reads inside the block to the replica, unless the request or its session wrote."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Reads go to the primary unless they run inside replica_reads, so Celery tasks & everything else
+    never see a lagging replica. Writes always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not (_read_primary.get() or _wrote.get()) and replica_configured():
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary.
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+
+
+class ReadPrimaryMiddleware:
+    """Pins a session to the primary for REPLICA_LAG_SECONDS after one of its requests wrote."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        read_primary_token = _read_primary.set(READ_PRIMARY_COOKIE in request.COOKIES)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get() and replica_configured():
+                response.set_cookie(
+                    READ_PRIMARY_COOKIE, "1", max_age=settings.REPLICA_LAG_SECONDS, httponly=True
+                )
+            return response
+        finally:
+            _read_primary.reset(read_primary_token)
+            _wrote.reset(wrote_token)
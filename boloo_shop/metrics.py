@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+from celery.signals import task_postrun, task_prerun, worker_process_init
+from celery.utils.log import current_process_index
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Worker & web processes share their samples through this directory when it is set,
+# it must be emptied whenever the processes are (re)started.
+MULTIPROC_DIR = os.environ.get("prometheus_multiproc_dir")
+# otherwise every worker pool process serves its own samples on this port plus its pool index.
+WORKER_METRICS_PORT = os.environ.get("WORKER_METRICS_PORT")
+
+TASK_DURATION = Histogram(
+    "boloo_task_duration_seconds", "Celery task run time.", ["task", "state"],
+)
+TASK_QUERIES = Histogram(
+    "boloo_task_db_queries",
+    "Database queries issued by a single Celery task run.",
+    ["task"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf")),
+)
+BOL_REQUEST_DURATION = Histogram(
+    "boloo_bol_request_duration_seconds", "bol.com request latency.", ["end_point", "status"],
+)
+BOL_THROTTLED = Counter("boloo_bol_throttled_total", "bol.com requests answered with 429.", ["end_point"])
+RATE_LIMIT_TOKENS = Counter(
+    "boloo_ratelimit_tokens_total",
+    "Rate limit tokens taken per seller & end point.",
+    ["seller", "end_point"],
+)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+_running_tasks = threading.local()
+
+
+@task_prerun.connect
+def start_task_timer(task_id, task, **kwargs):
+    counter = QueryCounter()
+    connection.execute_wrappers.append(counter)
+    if not hasattr(_running_tasks, "tasks"):
+        _running_tasks.tasks = {}
+    _running_tasks.tasks[task_id] = (time.monotonic(), counter)
+
+
+@task_postrun.connect
+def observe_task(task_id, task, state=None, **kwargs):
+    started_at, counter = getattr(_running_tasks, "tasks", {}).pop(task_id, (None, None))
+    if started_at is None:
+        return
+
+    if counter in connection.execute_wrappers:
+        connection.execute_wrappers.remove(counter)
+    TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.monotonic() - started_at)
+    TASK_QUERIES.labels(task.name).observe(counter.count)
+
+
+@worker_process_init.connect
+def serve_worker_metrics(**kwargs):
+    if WORKER_METRICS_PORT and not MULTIPROC_DIR:
+        start_http_server(int(WORKER_METRICS_PORT) + (current_process_index(base=0) or 0))
+
+
+def observe_bol_request(end_point_name, started_at, response=None):
+    status = str(response.status_code) if response is not None else "error"
+    BOL_REQUEST_DURATION.labels(end_point_name, status).observe(time.monotonic() - started_at)
+    if status == "429":
+        BOL_THROTTLED.labels(end_point_name).inc()
+
+
+class SyncCollector:
+    """Reads the sync backlog & the last flushed rate limits from the database at scrape time."""
+
+    def collect(self):
+        from sync.models import SellerEndPointTracker, SellerSyncStatus, ShipmentSyncTracker
+
+        backlog = GaugeMetricFamily(
+            "boloo_sync_backlog", "Shipment sync trackers per state.", labels=["state"]
+        )
+        counters = ShipmentSyncTracker.COUNTERS
+        totals = SellerSyncStatus.objects.aggregate(
+            **{counter: Sum(counter) for counter in counters.values()}
+        )
+        for state, _ in ShipmentSyncTracker.STATE_CHOICES:
+            backlog.add_metric([state], totals[counters[state]] or 0)
+        yield backlog
+
+        remaining = GaugeMetricFamily(
+            "boloo_ratelimit_remaining",
+            "Remaining bol.com requests per seller & end point, as last flushed.",
+            labels=["seller", "end_point"],
+        )
+        end_point_trackers = SellerEndPointTracker.objects.values_list(
+            "seller_id", "end_point_name", "remaining_req_limit"
+        )
+        for seller_id, end_point_name, remaining_req_limit in end_point_trackers:
+            remaining.add_metric([str(seller_id), end_point_name], remaining_req_limit)
+        yield remaining
+
+
+def process_registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    return registry
+
+
+def metrics_view(request):
+    sync_registry = CollectorRegistry()
+    sync_registry.register(SyncCollector())
+    output = generate_latest(process_registry()) + generate_latest(sync_registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
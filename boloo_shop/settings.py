@@ -11,9 +11,13 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import sys
 import urllib
 
+import dj_database_url
 import django_heroku
+from django.core.exceptions import ImproperlyConfigured
+from kombu import Queue
 
 # Register database schemes in URLs.
 urllib.parse.uses_netloc.append("mysql")
@@ -29,7 +33,9 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = ")xn*+jxc!sp^cuycs*3(124!v8vfh5v4z2mi19sv&)3$ulf^nq"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = bool(os.environ.get("DJANGO_DEBUG", True))
+DEBUG = os.environ.get("DJANGO_DEBUG", "True").lower() in ("1", "true", "yes")
+
+TESTING = sys.argv[1:2] == ["test"]
 
 ALLOWED_HOSTS = []
 
@@ -57,6 +63,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "boloo_shop.db_router.ReadPrimaryMiddleware",
 ]
 
 ROOT_URLCONF = "boloo_shop.urls"
@@ -107,6 +114,40 @@ if "JAWSDB_URL" in os.environ:
         }
     )
 
+# Optional read replica, SellerViewSet reads the sellers & their shipments from it. Sessions which
+# wrote read from the primary for REPLICA_LAG_SECONDS after, shipments pages are rebuilt once that
+# long after a sync.
+if "REPLICA_DATABASE_URL" in os.environ:
+    DATABASES["replica"] = dj_database_url.parse(os.environ["REPLICA_DATABASE_URL"])
+elif TESTING:
+    # the router is tested against a second database on the primary's server.
+    DATABASES["replica"] = dict(
+        DATABASES["default"], TEST={"NAME": "test_%s_replica" % DATABASES["default"]["NAME"]}
+    )
+DATABASE_ROUTERS = ["boloo_shop.db_router.ReplicaRouter"]
+REPLICA_LAG_SECONDS = int(os.environ.get("REPLICA_LAG_SECONDS", 5))
+
+# Cache, shared by the web & worker processes through Redis. Rate limits, dispatch keys, page versions
+# & tokens only work across processes through it, a per process cache is for development & tests only.
+if "REDIS_URL" in os.environ:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "OPTIONS": {"CLIENT_CLASS": "django_redis.client.DefaultClient"},
+        }
+    }
+elif DEBUG or TESTING:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+else:
+    raise ImproperlyConfigured("REDIS_URL is required unless DJANGO_DEBUG is on.")
+
+# Seconds a rendered page of seller shipments stays cached, pages are versioned per seller.
+SHIPMENTS_CACHE_TIMEOUT = int(os.environ.get("SHIPMENTS_CACHE_TIMEOUT", 300))
+
+# Shipments read per query while streaming a seller export.
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 1000))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -145,6 +186,51 @@ BROKER_POOL_LIMIT = os.environ.get("BROKER_POOL_LIMIT", None)
 CELERY_BROKER_URL = BROKER_URL
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
+# Token refreshes, list scans & detail fetches get queues of their own so a detail backlog never
+# delays a token refresh. Sellers still on their initial scan go through the onboarding queue.
+SYNC_ONBOARDING_QUEUE = "onboarding"
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_TASK_QUEUES = [Queue(name) for name in ("default", "tokens", "list", "detail", SYNC_ONBOARDING_QUEUE)]
+CELERY_TASK_ROUTES = {
+    "shipments.tasks.RefreshAccessToken": {"queue": "tokens"},
+    "shipments.tasks.RefreshAccessTokens": {"queue": "tokens"},
+    "sync.tasks.SyncShipmentListEndPoint": {"queue": "list"},
+    "sync.tasks.SyncShipmentDetailEndPoint": {"queue": "detail"},
+    "sync.tasks.SyncShipmentDetail": {"queue": "detail"},
+    "sync.tasks.SyncShipmentDetails": {"queue": "detail"},
+}
+# Tasks hold a process for seconds, prefetched messages would only wait behind them.
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get("CELERY_WORKER_PREFETCH_MULTIPLIER", 1))
+# Messages of a killed worker are redelivered, reruns are safe as detail batches are leased &
+# upserted and list scans resume from their checkpoint.
+CELERY_TASK_ACKS_LATE = True
+
+# bol.com HTTP client settings
+BOL_HTTP_POOL_SIZE = int(os.environ.get("BOL_HTTP_POOL_SIZE", 10))
+BOL_HTTP_CONNECT_TIMEOUT = float(os.environ.get("BOL_HTTP_CONNECT_TIMEOUT", 5))
+BOL_HTTP_READ_TIMEOUT = float(os.environ.get("BOL_HTTP_READ_TIMEOUT", 30))
+BOL_DETAIL_CONCURRENCY = int(os.environ.get("BOL_DETAIL_CONCURRENCY", 5))
+BOL_DETAIL_BATCH_SIZE = int(os.environ.get("BOL_DETAIL_BATCH_SIZE", 14))
+# Seconds a detail batch may hold its shipments before they are handed out again.
+SYNC_LEASE_SECONDS = int(os.environ.get("SYNC_LEASE_SECONDS", 300))
+# Runs are chained from bol.com's rate limit headers, a complete list scan is repeated after
+# SYNC_POLL_INTERVAL seconds. Beat only sweeps for stalled sellers every SYNC_SWEEP_MINUTES.
+SYNC_POLL_INTERVAL = int(os.environ.get("SYNC_POLL_INTERVAL", 30))
+SYNC_SWEEP_MINUTES = int(os.environ.get("SYNC_SWEEP_MINUTES", 5))
+
+# Shipments older than ARCHIVE_AFTER_DAYS are moved to the archive tables, ARCHIVE_BATCH_SIZE per transaction.
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 365))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 500))
+
+# Access tokens are refreshed TOKEN_REFRESH_LEAD (+ up to TOKEN_REFRESH_JITTER) seconds before they
+# expire, workers cache them for TOKEN_CACHE_TIMEOUT seconds.
+TOKEN_REFRESH_LEAD = int(os.environ.get("TOKEN_REFRESH_LEAD", 60))
+TOKEN_REFRESH_JITTER = int(os.environ.get("TOKEN_REFRESH_JITTER", 30))
+TOKEN_CACHE_TIMEOUT = int(os.environ.get("TOKEN_CACHE_TIMEOUT", 60))
+
+# Seconds between writes of the cached rate limit buckets back to SellerEndPointTracker.
+RATE_LIMIT_FLUSH_INTERVAL = int(os.environ.get("RATE_LIMIT_FLUSH_INTERVAL", 10))
+
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 50,
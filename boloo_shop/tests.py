@@ -0,0 +1,110 @@
+import contextvars
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils.timezone import now
+
+from shipments.models import Seller
+from shipments.tasks import RefreshAccessTokens
+
+from . import metrics
+from .db_router import READ_PRIMARY_COOKIE, REPLICA_DB_ALIAS, ReadPrimaryMiddleware, replica_reads
+
+
+def create_sellers(name="seller"):
+    """The same seller in both databases, with the name of the database it was read from."""
+    expires_at = {"default": now() + timedelta(minutes=1), REPLICA_DB_ALIAS: now() + timedelta(days=1)}
+    seller = None
+    for alias in ("default", REPLICA_DB_ALIAS):
+        seller = Seller.objects.using(alias).create(
+            id=seller.id if seller else None,
+            name=alias,
+            client_id=name,
+            client_secret="secret",
+            access_token="token",
+            token_expires_at=expires_at[alias],
+        )
+    return seller
+
+
+def in_new_context(function, *args):
+    # like a fresh worker thread, nothing of the test's own context leaks in.
+    return contextvars.Context().run(function, *args)
+
+
+class ReplicaRouterTests(TestCase):
+    databases = {"default", REPLICA_DB_ALIAS}
+
+    def setUp(self):
+        self.seller = create_sellers()
+
+    def test_routed_actions_read_the_replica(self):
+        self.assertEqual(self.client.get("/sellers/").json()["results"][0]["name"], REPLICA_DB_ALIAS)
+        self.assertEqual(self.client.get("/sellers/%s/" % self.seller.id).json()["name"], REPLICA_DB_ALIAS)
+
+        # a seller only the primary has yet.
+        Seller.objects.using(REPLICA_DB_ALIAS).filter(id=self.seller.id).delete()
+        self.assertEqual(self.client.get("/sellers/%s/shipments/" % self.seller.id).status_code, 404)
+        self.assertEqual(self.client.get("/sellers/%s/sync-status/" % self.seller.id).status_code, 200)
+
+    def test_write_pins_the_rest_of_the_request_to_the_primary(self):
+        reads = []
+
+        def view(request):
+            with replica_reads():
+                reads.append(Seller.objects.get(id=self.seller.id).name)
+                Seller.objects.filter(id=self.seller.id).update(name="renamed")
+                reads.append(Seller.objects.get(id=self.seller.id).name)
+            return HttpResponse()
+
+        response = in_new_context(ReadPrimaryMiddleware(view), RequestFactory().get("/"))
+
+        self.assertEqual(reads, [REPLICA_DB_ALIAS, "renamed"])
+        self.assertEqual(response.cookies[READ_PRIMARY_COOKIE]["max-age"], settings.REPLICA_LAG_SECONDS)
+
+    @mock.patch("shipments.views.schedule_dispatch")
+    def test_read_primary_cookie_pins_the_session(self, schedule_dispatch):
+        response = self.client.post("/sellers/%s/sync/" % self.seller.id)
+        self.assertIn(READ_PRIMARY_COOKIE, response.cookies)
+
+        self.assertEqual(self.client.get("/sellers/%s/" % self.seller.id).json()["name"], "default")
+
+        # other sessions keep reading the replica.
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get("/sellers/%s/" % self.seller.id).json()["name"], REPLICA_DB_ALIAS)
+
+    def test_reads_without_a_request_use_the_primary(self):
+        self.assertEqual(in_new_context(router.db_for_read, Seller), "default")
+        self.assertEqual(in_new_context(lambda: Seller.objects.get(id=self.seller.id).name), "default")
+
+    @mock.patch("shipments.tasks.schedule_refresh")
+    def test_celery_tasks_use_the_primary(self, schedule_refresh):
+        in_new_context(RefreshAccessTokens.run)
+
+        # only the primary's token expires within the refresh lead.
+        schedule_refresh.assert_called_once_with(
+            self.seller.id, Seller.objects.using("default").get(id=self.seller.id).token_expires_at
+        )
+
+
+class WorkerMetricsTests(TestCase):
+    @mock.patch.object(metrics, "MULTIPROC_DIR", None)
+    @mock.patch.object(metrics, "WORKER_METRICS_PORT", "9100")
+    @mock.patch("boloo_shop.metrics.current_process_index", return_value=2)
+    @mock.patch("boloo_shop.metrics.start_http_server")
+    def test_pool_process_serves_on_its_own_port(self, start_http_server, current_process_index):
+        metrics.serve_worker_metrics()
+
+        start_http_server.assert_called_once_with(9102)
+
+    @mock.patch.object(metrics, "MULTIPROC_DIR", "/tmp/metrics")
+    @mock.patch.object(metrics, "WORKER_METRICS_PORT", "9100")
+    @mock.patch("boloo_shop.metrics.start_http_server")
+    def test_shared_directory_is_served_by_the_web_process(self, start_http_server):
+        metrics.serve_worker_metrics()
+
+        start_http_server.assert_not_called()
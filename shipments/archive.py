@@ -0,0 +1,131 @@
+from django.db import transaction
+
+from .cache import bump_shipments_version
+from .filters import parse_since
+from .models import (
+    ArchiveCheckpoint,
+    ArchivedShipment,
+    ArchivedShipmentItem,
+    ArchivedTransport,
+    Shipment,
+    ShipmentItem,
+    Transport,
+)
+
+
+def copy_rows(instances, archive_model):
+    field_names = [field.attname for field in archive_model._meta.concrete_fields]
+    archive_model.objects.bulk_create(
+        [archive_model(**{name: getattr(instance, name) for name in field_names}) for instance in instances]
+    )
+
+
+def archive_shipments(cutoff, batch_size):
+    """
+    Moves up to batch_size shipments dated before cutoff with their items & transports to the
+    archive, in one short transaction. Rows locked by a sync are left for the next batch.
+    Returns the number of moved shipments.
+    """
+    with transaction.atomic():
+        shipments = list(
+            Shipment.objects.filter(shipment_date__lt=cutoff)
+            .order_by("id")
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not shipments:
+            return 0
+
+        shipment_ids = [shipment.id for shipment in shipments]
+        transport_ids = [shipment.transport_id for shipment in shipments if shipment.transport_id]
+        copy_rows(Transport.objects.filter(id__in=transport_ids), ArchivedTransport)
+        copy_rows(shipments, ArchivedShipment)
+        copy_rows(ShipmentItem.objects.filter(shipment_id__in=shipment_ids), ArchivedShipmentItem)
+
+        ShipmentItem.objects.filter(shipment_id__in=shipment_ids).delete()
+        Shipment.objects.filter(id__in=shipment_ids).delete()
+        Transport.objects.filter(id__in=transport_ids).delete()
+
+        for seller_id in {shipment.seller_id for shipment in shipments}:
+            transaction.on_commit(lambda seller_id=seller_id: bump_shipments_version(seller_id))
+
+    return len(shipments)
+
+
+def start_archive(cutoff):
+    """Records a pass's cutoff before it moves anything, so no archived shipment is dated at or after it."""
+    checkpoint, created = ArchiveCheckpoint.objects.get_or_create(id=1, defaults={"archived_before": cutoff})
+    if not created and checkpoint.archived_before < cutoff:
+        checkpoint.archived_before = cutoff
+        checkpoint.save()
+
+
+class ShipmentChain:
+    """
+    Querysets of shipments read one after the other, newest first, so the paginators see a single
+    queryset ordered by shipment date. Archived shipments are older than the others, except for old
+    shipments which were first synced after their pass, until the next pass moves them.
+    """
+
+    ordered = True
+
+    def __init__(self, querysets, descending=True):
+        self.newest_first = list(querysets)
+        self.descending = descending
+        self.counts = {}
+
+    @property
+    def querysets(self):
+        return self.newest_first if self.descending else self.newest_first[::-1]
+
+    def filter(self, *args, **kwargs):
+        querysets = [queryset.filter(*args, **kwargs) for queryset in self.newest_first]
+        return ShipmentChain(querysets, self.descending)
+
+    def order_by(self, *field_names):
+        descending = not field_names or field_names[0].startswith("-")
+        return ShipmentChain([queryset.order_by(*field_names) for queryset in self.newest_first], descending)
+
+    def queryset_count(self, index):
+        if index not in self.counts:
+            self.counts[index] = self.querysets[index].count()
+        return self.counts[index]
+
+    def count(self, up_to=None):
+        """Querysets after the first up_to rows are only counted if the earlier ones hold no more rows."""
+        total = 0
+        for index in range(len(self.querysets)):
+            if up_to is not None and total > up_to:
+                break
+            total += self.queryset_count(index)
+        return total
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key : key + 1][0]
+
+        offset = key.start or 0
+        limit = None if key.stop is None else key.stop - offset
+        results = []
+        for index, queryset in enumerate(self.querysets):
+            if limit is not None and limit <= 0:
+                break
+            rows = list(queryset[offset : None if limit is None else offset + limit])
+            if rows:
+                offset = 0
+                limit = None if limit is None else limit - len(rows)
+            elif offset:
+                offset = max(offset - self.queryset_count(index), 0)
+            results.extend(rows)
+        return results
+
+    def __iter__(self):
+        return iter(self[0:])
+
+
+def reads_archive(query_params):
+    """Whether the listing reaches back far enough to include archived shipments."""
+    checkpoint = ArchiveCheckpoint.objects.first()
+    if checkpoint is None:
+        return False
+    after = query_params.get("shipment_date_after")
+    return not after or parse_since(after, "shipment_date_after") < checkpoint.archived_before
@@ -0,0 +1,57 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from boloo_shop.db_router import replica_configured
+
+
+def shipments_version_key(seller_id):
+    return "shipments:version:%s" % seller_id
+
+
+def shipments_version(seller_id):
+    # versions start from the current time so an evicted key never reuses an old version.
+    key = shipments_version_key(seller_id)
+    cache.add(key, int(time.time() * 1000), timeout=None)
+    return cache.get(key)
+
+
+def increment_shipments_version(seller_id):
+    key = shipments_version_key(seller_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def bump_shipments_version(seller_id):
+    increment_shipments_version(seller_id)
+    if replica_configured():
+        from .tasks import BumpShipmentsVersion
+
+        # pages read from the replica before it caught up are cached under the new version, drop them too.
+        BumpShipmentsVersion.apply_async(args=[seller_id], countdown=settings.REPLICA_LAG_SECONDS)
+
+
+def page_digest(request):
+    return hashlib.md5(
+        ("%s:%s" % (request.accepted_renderer.format, request.build_absolute_uri())).encode()
+    ).hexdigest()
+
+
+def shipments_page_key(seller_id, version, request):
+    return "shipments:%s:%s:%s" % (seller_id, version, page_digest(request))
+
+
+def get_shipments_page(seller_id, version, request):
+    return cache.get(shipments_page_key(seller_id, version, request))
+
+
+def set_shipments_page(seller_id, version, request, data):
+    cache.set(shipments_page_key(seller_id, version, request), data, timeout=settings.SHIPMENTS_CACHE_TIMEOUT)
+
+
+def shipments_etag(seller_id, version, request):
+    return '"%s-%s-%s"' % (seller_id, version, page_digest(request))
@@ -0,0 +1,75 @@
+import csv
+import json
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from djangorestframework_camel_case.util import camelize, camelize_re, underscore_to_camel
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import ShipmentItemSerializer, ShipmentSerializer, TransportSerializer, UserDataSerializer
+
+
+def iter_shipment_chunks(querysets):
+    """
+    Yields the shipments of each queryset in chunks of EXPORT_CHUNK_SIZE, paging on the primary key
+    so memory stays constant even where the database driver does not stream results (MySQL).
+    """
+    for queryset in querysets:
+        queryset = queryset.select_related("transport", "customer", "billing").order_by("id")
+        last_id = 0
+
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[: settings.EXPORT_CHUNK_SIZE])
+            if not chunk:
+                break
+
+            prefetch_related_objects(chunk, "items")
+            yield ShipmentSerializer(chunk, many=True).data
+            last_id = chunk[-1].id
+
+
+def ndjson_rows(querysets):
+    for shipments in iter_shipment_chunks(querysets):
+        yield "".join(json.dumps(camelize(shipment), cls=JSONEncoder) + "\n" for shipment in shipments)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_columns():
+    columns = [
+        field_name
+        for field_name in ShipmentSerializer.Meta.fields
+        if field_name not in ("shipment_items", "transport", "customer_details", "billing_details")
+    ]
+    columns += ["transport.%s" % field_name for field_name in TransportSerializer().fields]
+    columns += ["customer_details.%s" % field_name for field_name in UserDataSerializer().fields]
+    columns += ["billing_details.%s" % field_name for field_name in UserDataSerializer().fields]
+    columns += ["shipment_items.%s" % field_name for field_name in ShipmentItemSerializer().fields]
+    return columns
+
+
+def csv_value(data, column):
+    for key in column.split("."):
+        if data is None:
+            return ""
+        data = data.get(key)
+
+    return "" if data is None else data
+
+
+def csv_rows(querysets):
+    """One row per shipment item, repeating the shipment, transport & user data columns."""
+    columns = csv_columns()
+    writer = csv.writer(Echo())
+    yield writer.writerow([camelize_re.sub(underscore_to_camel, column) for column in columns])
+
+    for shipments in iter_shipment_chunks(querysets):
+        rows = []
+        for shipment in shipments:
+            for item in shipment["shipment_items"] or [{}]:
+                row = dict(shipment, shipment_items=item)
+                rows.append(writer.writerow([csv_value(row, column) for column in columns]))
+        yield "".join(rows)
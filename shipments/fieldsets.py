@@ -0,0 +1,76 @@
+from django.db.models import Prefetch
+from djangorestframework_camel_case.util import camel_to_underscore
+from rest_framework import serializers
+
+from .serializers import ShipmentSerializer, nested_serializer
+
+# always loaded, the listing orders & paginates on them and seller.shipments reads the seller.
+REQUIRED_FIELDS = ("id", "seller", "shipment_date")
+
+
+def parse_fieldset(query_params):
+    """
+    Reads ?fields= & ?expand= into {field name: None for the whole field or a set of its fields}.
+    fields takes shipment fields & relation.field paths, expand takes whole relations. Returns
+    None when neither is given, the full shipment is rendered then.
+    """
+    if not query_params.get("fields") and not query_params.get("expand"):
+        return None
+
+    available = ShipmentSerializer().fields
+    fieldset = {}
+    if not query_params.get("fields"):
+        # expand alone adds relations to the shipment's own fields.
+        fieldset = {name: None for name, field in available.items() if nested_serializer(field) is None}
+
+    for param in ("fields", "expand"):
+        for path in query_params.get(param, "").split(","):
+            name, _, sub_name = camel_to_underscore(path.strip()).partition(".")
+            if not name:
+                continue
+
+            field = available.get(name)
+            nested = nested_serializer(field) if field is not None else None
+            if field is None or (nested is None and (sub_name or param == "expand")):
+                raise serializers.ValidationError({param: "Unknown field %s." % path.strip()})
+            if sub_name and sub_name not in nested.fields:
+                raise serializers.ValidationError({param: "Unknown field %s." % path.strip()})
+
+            if sub_name and fieldset.get(name, set()) is not None:
+                fieldset.setdefault(name, set()).add(sub_name)
+            else:
+                fieldset[name] = None
+    return fieldset
+
+
+def source_names(serializer, sub_names):
+    names = sub_names if sub_names is not None else serializer.fields
+    return [serializer.fields[name].source for name in names]
+
+
+def fieldset_queryset(shipments, fieldset):
+    """Joins, prefetches & loads only what the fieldset renders from a shipment manager."""
+    if fieldset is None:
+        return shipments.with_details()
+
+    queryset = shipments.all()
+    available = ShipmentSerializer().fields
+    loaded = list(REQUIRED_FIELDS)
+    for name, sub_names in fieldset.items():
+        field = available[name]
+        nested = nested_serializer(field)
+        if nested is None:
+            loaded.append(field.source)
+        elif isinstance(field, serializers.ListSerializer):
+            # the prefetched rows are matched to their shipment by the foreign key.
+            relation = queryset.model._meta.get_field(field.source)
+            related_queryset = relation.related_model.objects.only(
+                relation.field.name, *source_names(nested, sub_names)
+            )
+            queryset = queryset.prefetch_related(Prefetch(field.source, queryset=related_queryset))
+        else:
+            queryset = queryset.select_related(field.source)
+            loaded.append(field.source)
+            loaded.extend("%s__%s" % (field.source, source) for source in source_names(nested, sub_names))
+
+    return queryset.only(*loaded)
@@ -0,0 +1,63 @@
+from datetime import datetime, time
+
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_naive, make_aware
+from rest_framework import serializers
+
+from sync import constants
+
+
+def parse_since(value, name="since"):
+    try:
+        since = parse_datetime(value)
+        if since is None and parse_date(value) is not None:
+            since = make_aware(datetime.combine(parse_date(value), time.min))
+    except ValueError:
+        since = None
+
+    if since is None:
+        raise serializers.ValidationError({name: "Expected a date or datetime."})
+
+    # datetimes without an offset are in the current time zone, like dates.
+    return make_aware(since) if is_naive(since) else since
+
+
+def filter_shipments(queryset, query_params):
+    """
+    Narrows a seller's shipments down by the listing's query parameters. Item filters are
+    subqueries on the item indexes, so the shipments keep their (seller, shipment_date) index.
+    """
+    if query_params.get("shipment_date_after"):
+        after = parse_since(query_params["shipment_date_after"], "shipment_date_after")
+        queryset = queryset.filter(shipment_date__gte=after)
+
+    if query_params.get("shipment_date_before"):
+        before = parse_since(query_params["shipment_date_before"], "shipment_date_before")
+        queryset = queryset.filter(shipment_date__lt=before)
+
+    # track & trace codes, eans & order ids are selective, the matching rows are looked up first.
+    # archived shipments have items & transports of their own.
+    item_model = queryset.model._meta.get_field("items").related_model
+    transport_model = queryset.model._meta.get_field("transport").related_model
+
+    if query_params.get("track_and_trace"):
+        transports = transport_model.objects.filter(track_and_trace=query_params["track_and_trace"])
+        queryset = queryset.filter(transport_id__in=transports.values("id"))
+
+    for name in ("ean", "order_id"):
+        if query_params.get(name):
+            items = item_model.objects.filter(**{name: query_params[name]})
+            queryset = queryset.filter(id__in=items.values("shipment_id"))
+
+    fulfilment_method = query_params.get("fulfilment_method")
+    if fulfilment_method:
+        if fulfilment_method not in constants.FULFILMENT_METHODS:
+            raise serializers.ValidationError(
+                {"fulfilment_method": "Expected one of %s." % ", ".join(constants.FULFILMENT_METHODS)}
+            )
+        # only a few methods exist, so it's checked per shipment of the seller instead.
+        items = item_model.objects.filter(shipment_id=OuterRef("id"), fulfilment_method=fulfilment_method)
+        queryset = queryset.filter(Exists(items))
+
+    return queryset
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipment',
+            index=models.Index(fields=['seller', 'shipment_date', 'id'], name='shipments_s_seller__a497ac_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+import hashlib
+import json
+
+from django.db import migrations, models
+
+# frozen copy of UserData.HASH_FIELDS & UserData.compute_hash as of this migration.
+HASH_FIELDS = (
+    "pick_up_point_name",
+    "saluation_code",
+    "first_name",
+    "surname",
+    "street_name",
+    "house_number",
+    "house_number_extended",
+    "address_supplement",
+    "extra_address_information",
+    "zip_code",
+    "city",
+    "country_code",
+    "email",
+    "company",
+    "vat_number",
+    "chamber_of_commerce_number",
+    "order_reference",
+    "delivery_phone_number",
+)
+
+
+def compute_hash(data):
+    values = [str(data.get(field) or "").strip() for field in HASH_FIELDS]
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def fill_content_hashes(apps, schema_editor):
+    UserData = apps.get_model("shipments", "UserData")
+    Shipment = apps.get_model("shipments", "Shipment")
+    kept_ids = {}
+
+    for user_data in UserData.objects.order_by("id").iterator():
+        content_hash = compute_hash(user_data.__dict__)
+
+        if content_hash in kept_ids:
+            # collapse duplicate rows into the first one having the same content.
+            Shipment.objects.filter(customer_id=user_data.id).update(customer_id=kept_ids[content_hash])
+            Shipment.objects.filter(billing_id=user_data.id).update(billing_id=kept_ids[content_hash])
+            user_data.delete()
+            continue
+
+        kept_ids[content_hash] = user_data.id
+        UserData.objects.filter(id=user_data.id).update(content_hash=content_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0002_shipment_seller_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdata',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_content_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='userdata',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+    ]
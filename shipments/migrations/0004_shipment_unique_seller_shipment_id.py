@@ -0,0 +1,39 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:38
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def collapse_duplicate_shipments(apps, schema_editor):
+    Shipment = apps.get_model("shipments", "Shipment")
+    Transport = apps.get_model("shipments", "Transport")
+
+    duplicates = (
+        Shipment.objects.order_by()
+        .values("seller_id", "shipment_id")
+        .annotate(count=Count("id"), kept_id=Max("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        # the newest copy is kept, the others go together with their items & transports.
+        stale_shipments = Shipment.objects.filter(
+            seller_id=duplicate["seller_id"], shipment_id=duplicate["shipment_id"]
+        ).exclude(id=duplicate["kept_id"])
+        transport_ids = list(stale_shipments.exclude(transport=None).values_list("transport_id", flat=True))
+        stale_shipments.delete()
+        Transport.objects.filter(id__in=transport_ids, transported_shipments__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0003_userdata_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicate_shipments, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='shipment',
+            unique_together={('seller', 'shipment_id')},
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0004_shipment_unique_seller_shipment_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipmentitem',
+            index=models.Index(fields=['ean', 'shipment'], name='shipments_s_ean_59266b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentitem',
+            index=models.Index(fields=['order_id', 'shipment'], name='shipments_s_order_i_6461c5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentitem',
+            index=models.Index(fields=['shipment', 'fulfilment_method'], name='shipments_s_shipmen_b975b6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transport',
+            index=models.Index(fields=['track_and_trace'], name='shipments_t_track_a_2ec596_idx'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0005_listing_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archived_before', models.DateTimeField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedShipment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shipment_id', models.IntegerField()),
+                ('pick_up_point', models.BooleanField()),
+                ('shipment_date', models.DateTimeField()),
+                ('shipment_reference', models.CharField(blank=True, max_length=255)),
+                ('billing', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_billed_shipments', to='shipments.UserData')),
+                ('customer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_shipments', to='shipments.UserData')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_shipments', to='shipments.Seller')),
+            ],
+            options={
+                'ordering': ('-shipment_date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transport_id', models.IntegerField()),
+                ('transporter_code', models.CharField(max_length=255)),
+                ('track_and_trace', models.CharField(max_length=255)),
+                ('shipping_label_id', models.IntegerField(null=True)),
+                ('shipping_label_code', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedShipmentItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_item_id', models.CharField(max_length=255)),
+                ('order_id', models.CharField(max_length=255)),
+                ('order_date', models.DateTimeField()),
+                ('latest_delivery_date', models.DateTimeField()),
+                ('ean', models.CharField(max_length=255)),
+                ('title', models.CharField(max_length=255)),
+                ('quantity', models.IntegerField()),
+                ('offer_price', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('offer_condition', models.CharField(max_length=255)),
+                ('offer_reference', models.CharField(blank=True, max_length=255)),
+                ('fulfilment_method', models.CharField(max_length=3)),
+                ('shipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='shipments.ArchivedShipment')),
+            ],
+            options={
+                'ordering': ('-order_date',),
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedshipment',
+            name='transport',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transported_shipments', to='shipments.ArchivedTransport'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedshipment',
+            index=models.Index(fields=['seller', 'shipment_date', 'id'], name='shipments_a_seller__38f538_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedshipment',
+            unique_together={('seller', 'shipment_id')},
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0006_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedshipmentitem',
+            index=models.Index(fields=['ean', 'shipment'], name='shipments_a_ean_5fe4f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedshipmentitem',
+            index=models.Index(fields=['order_id', 'shipment'], name='shipments_a_order_i_fddccf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedshipmentitem',
+            index=models.Index(fields=['shipment', 'fulfilment_method'], name='shipments_a_shipmen_f82a9c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransport',
+            index=models.Index(fields=['track_and_trace'], name='shipments_a_track_a_bc4efb_idx'),
+        ),
+    ]
@@ -1,4 +1,9 @@
-from django.db import models
+import hashlib
+import json
+
+from datetime import timedelta
+
+from django.db import connections, models, router
 from django.utils.timezone import now
 
 
@@ -6,6 +11,54 @@ class SellerManager(models.Manager):
     def token_expired_sellers(self):
         return self.filter(token_expires_at__lte=now())
 
+    def token_expiring_sellers(self, within):
+        return self.filter(token_expires_at__lte=now() + timedelta(seconds=within))
+
+
+class ShipmentManager(models.Manager):
+    def with_details(self):
+        return self.select_related("transport", "customer", "billing").prefetch_related("items")
+
+    def upsert(self, shipments):
+        """
+        Inserts the shipments in bulk, a shipment the seller already has is updated in place instead.
+        The ids are not set on the instances.
+        """
+        connection = connections[self._db or router.db_for_write(self.model)]
+        quote_name = connection.ops.quote_name
+        fields = [field for field in self.model._meta.concrete_fields if not field.primary_key]
+        columns = [quote_name(field.column) for field in fields]
+        updates = [
+            column for field, column in zip(fields, columns) if field.name not in ("seller", "shipment_id")
+        ]
+
+        if connection.vendor == "mysql":
+            on_conflict = "ON DUPLICATE KEY UPDATE %s" % ", ".join(
+                "%s = VALUES(%s)" % (column, column) for column in updates
+            )
+        else:
+            on_conflict = "ON CONFLICT (%s, %s) DO UPDATE SET %s" % (
+                quote_name("seller_id"),
+                quote_name("shipment_id"),
+                ", ".join("%s = excluded.%s" % (column, column) for column in updates),
+            )
+
+        batch_size = connection.ops.bulk_batch_size(fields, shipments)
+        with connection.cursor() as cursor:
+            for start in range(0, len(shipments), batch_size):
+                batch = shipments[start : start + batch_size]
+                rows = ", ".join(["(%s)" % ", ".join(["%s"] * len(fields))] * len(batch))
+                params = [
+                    field.get_db_prep_save(getattr(shipment, field.attname), connection)
+                    for shipment in batch
+                    for field in fields
+                ]
+                cursor.execute(
+                    "INSERT INTO %s (%s) VALUES %s %s"
+                    % (quote_name(self.model._meta.db_table), ", ".join(columns), rows, on_conflict),
+                    params,
+                )
+
 
 class Seller(models.Model):
     name = models.CharField(max_length=255)
@@ -22,15 +75,72 @@ class Seller(models.Model):
         ordering = ("-updated",)
 
 
-class Transport(models.Model):
+class BaseTransport(models.Model):
     transport_id = models.IntegerField()
     transporter_code = models.CharField(max_length=255)
     track_and_trace = models.CharField(max_length=255)
     shipping_label_id = models.IntegerField(null=True)
     shipping_label_code = models.CharField(max_length=255, blank=True)
 
+    class Meta:
+        abstract = True
+
+
+class Transport(BaseTransport):
+    class Meta:
+        indexes = [models.Index(fields=["track_and_trace"])]
+
+
+class UserDataManager(models.Manager):
+    def get_or_create_by_hash(self, **data):
+        data = self.model.normalize(data)
+        return self.get_or_create(content_hash=self.model.compute_hash(data), defaults=data)
+
+    def bulk_get_or_create(self, data_list):
+        """Returns a UserData instance for every dict in data_list, in the same order."""
+        data_by_hash = {}
+        for data in data_list:
+            data = self.model.normalize(data)
+            data_by_hash[self.model.compute_hash(data)] = data
+
+        instances = self.in_bulk(list(data_by_hash), field_name="content_hash")
+        missing = [
+            self.model(content_hash=content_hash, **data)
+            for content_hash, data in data_by_hash.items()
+            if content_hash not in instances
+        ]
+        if missing:
+            self.bulk_create(missing, ignore_conflicts=True)
+            instances.update(
+                self.in_bulk([instance.content_hash for instance in missing], field_name="content_hash")
+            )
+
+        return [instances[self.model.compute_hash(data)] for data in data_list]
+
 
 class UserData(models.Model):
+    HASH_FIELDS = (
+        "pick_up_point_name",
+        "saluation_code",
+        "first_name",
+        "surname",
+        "street_name",
+        "house_number",
+        "house_number_extended",
+        "address_supplement",
+        "extra_address_information",
+        "zip_code",
+        "city",
+        "country_code",
+        "email",
+        "company",
+        "vat_number",
+        "chamber_of_commerce_number",
+        "order_reference",
+        "delivery_phone_number",
+    )
+
+    content_hash = models.CharField(max_length=64, unique=True, editable=False)
     pick_up_point_name = models.CharField(max_length=255, blank=True)
     saluation_code = models.CharField(max_length=255, blank=True)
     first_name = models.CharField(max_length=255, blank=True)
@@ -50,23 +160,47 @@ class UserData(models.Model):
     order_reference = models.CharField(max_length=255, blank=True)
     delivery_phone_number = models.CharField(max_length=255, blank=True)
 
+    objects = UserDataManager()
 
-class Shipment(models.Model):
-    seller = models.ForeignKey("shipments.seller", on_delete=models.CASCADE, related_name="shipments")
+    @classmethod
+    def normalize(cls, data):
+        return {field: str(data.get(field) or "").strip() for field in cls.HASH_FIELDS}
+
+    @classmethod
+    def compute_hash(cls, data):
+        values = list(cls.normalize(data).values())
+        return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_hash(self.__dict__)
+        super().save(*args, **kwargs)
+
+
+class BaseShipment(models.Model):
     shipment_id = models.IntegerField()
     pick_up_point = models.BooleanField()
     shipment_date = models.DateTimeField()
     shipment_reference = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        abstract = True
+
+
+class Shipment(BaseShipment):
+    seller = models.ForeignKey("shipments.seller", on_delete=models.CASCADE, related_name="shipments")
     transport = models.ForeignKey("shipments.transport", related_name="transported_shipments", null=True, on_delete=models.SET_NULL)
     customer = models.ForeignKey("shipments.userdata", null=True, on_delete=models.SET_NULL)
     billing = models.ForeignKey("shipments.userdata", related_name="billed_shipments", null=True, on_delete=models.SET_NULL)
 
+    objects = ShipmentManager()
+
     class Meta:
         ordering = ("-shipment_date",)
+        unique_together = ("seller", "shipment_id")
+        indexes = [models.Index(fields=["seller", "shipment_date", "id"])]
 
 
-class ShipmentItem(models.Model):
-    shipment = models.ForeignKey("shipments.shipment", related_name="items", on_delete=models.CASCADE)
+class BaseShipmentItem(models.Model):
     order_item_id = models.CharField(max_length=255)
     order_id = models.CharField(max_length=255)
     order_date = models.DateTimeField()
@@ -79,5 +213,68 @@ class ShipmentItem(models.Model):
     offer_reference = models.CharField(max_length=255, blank=True)
     fulfilment_method = models.CharField(max_length=3)
 
+    class Meta:
+        abstract = True
+
+
+class ShipmentItem(BaseShipmentItem):
+    shipment = models.ForeignKey("shipments.shipment", related_name="items", on_delete=models.CASCADE)
+
     class Meta:
         ordering = ("-order_date", )
+        indexes = [
+            models.Index(fields=["ean", "shipment"]),
+            models.Index(fields=["order_id", "shipment"]),
+            models.Index(fields=["shipment", "fulfilment_method"]),
+        ]
+
+
+# Shipments older than ARCHIVE_AFTER_DAYS are moved to the tables below by the ArchiveShipments
+# task, keeping their ids. Customer & billing details are shared so they stay in UserData.
+class ArchivedTransport(BaseTransport):
+    class Meta:
+        indexes = [models.Index(fields=["track_and_trace"])]
+
+
+class ArchivedShipment(BaseShipment):
+    seller = models.ForeignKey(
+        "shipments.seller", on_delete=models.CASCADE, related_name="archived_shipments"
+    )
+    transport = models.ForeignKey(
+        "shipments.archivedtransport",
+        related_name="transported_shipments",
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    customer = models.ForeignKey(
+        "shipments.userdata", related_name="archived_shipments", null=True, on_delete=models.SET_NULL
+    )
+    billing = models.ForeignKey(
+        "shipments.userdata", related_name="archived_billed_shipments", null=True, on_delete=models.SET_NULL
+    )
+
+    objects = ShipmentManager()
+
+    class Meta:
+        ordering = ("-shipment_date",)
+        unique_together = ("seller", "shipment_id")
+        indexes = [models.Index(fields=["seller", "shipment_date", "id"])]
+
+
+class ArchivedShipmentItem(BaseShipmentItem):
+    shipment = models.ForeignKey("shipments.archivedshipment", related_name="items", on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ("-order_date",)
+        indexes = [
+            models.Index(fields=["ean", "shipment"]),
+            models.Index(fields=["order_id", "shipment"]),
+            models.Index(fields=["shipment", "fulfilment_method"]),
+        ]
+
+
+class ArchiveCheckpoint(models.Model):
+    """No archived shipment is dated at or after archived_before, the cutoff of the latest pass."""
+
+    archived_before = models.DateTimeField()
+    updated = models.DateTimeField(auto_now=True)
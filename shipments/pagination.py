@@ -0,0 +1,27 @@
+from django.core.paginator import Paginator
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .archive import ShipmentChain
+
+
+class ShipmentCursorPagination(CursorPagination):
+    ordering = ("-shipment_date", "-id")
+
+
+class ShipmentChainPaginator(Paginator):
+    """
+    Only counts the archived shipments of a ShipmentChain once the page reaches them, the count of
+    earlier pages is that of the recent shipments.
+    """
+
+    def page(self, number):
+        if isinstance(self.object_list, ShipmentChain):
+            try:
+                self.count = self.object_list.count(up_to=int(number) * self.per_page)
+            except (TypeError, ValueError):
+                pass
+        return super().page(number)
+
+
+class ShipmentPageNumberPagination(PageNumberPagination):
+    django_paginator_class = ShipmentChainPaginator
@@ -6,8 +6,11 @@ from django.utils.timezone import now
 from django_celery_beat.models import IntervalSchedule, PeriodicTask
 from requests.exceptions import HTTPError
 from rest_framework import serializers
+from sync import constants
+from sync.models import SellerEndPointTracker, SellerSyncStatus
 
 from .models import Seller, Shipment, ShipmentItem, Transport, UserData
+from .tasks import schedule_refresh
 from .utils import AccessToken
 
 
@@ -45,8 +48,23 @@ class SellerSerializer(serializers.ModelSerializer):
         PeriodicTask.objects.get_or_create(
             interval=schedule, name="Refresh Access Tokens", task="shipments.tasks.RefreshAccessTokens",
         )
+        AccessToken.cache(instance.id, instance.access_token, instance.token_expires_at)
+        schedule_refresh(instance.id, instance.token_expires_at)
         return instance
 
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        AccessToken.cache(instance.id, instance.access_token, instance.token_expires_at)
+        return instance
+
+
+def nested_serializer(field):
+    if isinstance(field, serializers.ListSerializer):
+        return field.child
+    if isinstance(field, serializers.ModelSerializer):
+        return field
+    return None
+
 
 class ShipmentItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -67,6 +85,7 @@ class UserDataSerializer(serializers.ModelSerializer):
         model = UserData
         exclude = [
             "id",
+            "content_hash",
         ]
 
 
@@ -89,22 +108,50 @@ class ShipmentSerializer(serializers.ModelSerializer):
             "billing_details",
         ]
 
-    def create(self, validated_data):
-        shipment_items = validated_data.pop("items")
-        validated_data["seller"] = self.context["seller"]
-        validated_data["transport"] = Transport.objects.create(**validated_data["transport"])
-        validated_data["customer"], _ = UserData.objects.get_or_create(**validated_data["customer"])
+    def __init__(self, *args, fieldset=None, **kwargs):
+        # fieldset as parsed by shipments.fieldsets.parse_fieldset, None renders every field.
+        super().__init__(*args, **kwargs)
+        if fieldset is None:
+            return
 
-        if validated_data.get("billing"):
-            validated_data["billing"], _ = UserData.objects.get_or_create(**validated_data["billing"])
+        for name in list(self.fields):
+            if name not in fieldset:
+                self.fields.pop(name)
+            elif fieldset[name] is not None:
+                nested = nested_serializer(self.fields[name])
+                for sub_name in list(nested.fields):
+                    if sub_name not in fieldset[name]:
+                        nested.fields.pop(sub_name)
 
-        shipment_instance = super().create(validated_data)
 
-        shipment_item_instances = []
-        for shipment_item in shipment_items:
-            shipment_item["shipment"] = shipment_instance
-            shipment_item_instances.append(ShipmentItem(**shipment_item))
+class SellerEndPointTrackerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SellerEndPointTracker
+        fields = [
+            "end_point_name",
+            "remaining_req_limit",
+            "limit_reset_at",
+            "initial_fbr_completed",
+            "initial_fbb_completed",
+        ]
+
 
-        ShipmentItem.objects.bulk_create(shipment_item_instances)
+class SellerSyncStatusSerializer(serializers.ModelSerializer):
+    """Expects the seller's end point trackers as end_point_trackers in the context."""
 
-        return shipment_instance
+    end_points = serializers.SerializerMethodField()
+    eta = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SellerSyncStatus
+        fields = ["discovered", "pending", "in_flight", "finished", "failed", "updated", "end_points", "eta"]
+
+    def get_end_points(self, instance):
+        return SellerEndPointTrackerSerializer(self.context["end_point_trackers"], many=True).data
+
+    def get_eta(self, instance):
+        for end_point_tracker in self.context["end_point_trackers"]:
+            if end_point_tracker.end_point_name == constants.SHIPMENT_DETAIL_ENDPOINT_NAME:
+                eta = instance.eta(end_point_tracker)
+                return serializers.DateTimeField().to_representation(eta) if eta else None
+        return None
@@ -1,23 +1,93 @@
-from requests import HTTPError
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
 
 from boloo_shop import celery_app
 from shipments.utils import AccessToken
 
-from .models import Seller
+from .archive import archive_shipments, start_archive
+from .cache import increment_shipments_version
+from .models import Seller, Shipment
+
+
+def refresh_lock_key(seller_id):
+    return "access_token:refresh:%s" % seller_id
+
+
+def schedule_refresh(seller_id, token_expires_at):
+    """
+    Schedules a seller's token refresh TOKEN_REFRESH_LEAD seconds before it expires, jittered so
+    refreshes of many sellers are spread out. At most one refresh is pending per seller.
+    """
+    eta = token_expires_at - timedelta(
+        seconds=settings.TOKEN_REFRESH_LEAD + random.uniform(0, settings.TOKEN_REFRESH_JITTER)
+    )
+    if eta < now():
+        eta = now() + timedelta(seconds=random.uniform(0, settings.TOKEN_REFRESH_JITTER))
+
+    timeout = int((eta - now()).total_seconds()) + settings.TOKEN_REFRESH_LEAD
+    if cache.add(refresh_lock_key(seller_id), True, timeout=timeout):
+        RefreshAccessToken.apply_async(
+            args=[seller_id,], eta=eta, retry=True, retry_policy={"max_retries": 3}
+        )
+
+
+def refresh_rejected_token(seller_id):
+    """bol.com rejected the token before we expected it to expire, refresh it straight away."""
+    AccessToken.invalidate(seller_id)
+    RefreshAccessToken.apply_async(args=[seller_id,], retry=True, retry_policy={"max_retries": 3})
 
 
 class RefreshAccessToken(celery_app.Task):
     def run(self, seller_id):
+        cache.delete(refresh_lock_key(seller_id))
         seller = Seller.objects.get(id=seller_id)
         response = AccessToken.fetch(seller.client_id, seller.client_secret)
         AccessToken.save(seller, response)
+        schedule_refresh(seller.id, seller.token_expires_at)
 
 
 class RefreshAccessTokens(celery_app.Task):
+    """Safety net for sellers without a scheduled refresh, e.g. after a failed one."""
+
     def run(self):
-        for seller_id in Seller.objects.token_expired_sellers().values_list("id", flat=True):
-            RefreshAccessToken.apply_async(args=[seller_id,], retry=True, retry_policy={"max_retries": 3})
+        within = settings.TOKEN_REFRESH_LEAD + settings.TOKEN_REFRESH_JITTER + 60
+        for seller_id, token_expires_at in Seller.objects.token_expiring_sellers(within).values_list(
+            "id", "token_expires_at"
+        ):
+            schedule_refresh(seller_id, token_expires_at)
+
+
+class ArchiveShipments(celery_app.Task):
+    """
+    Moves shipments older than ARCHIVE_AFTER_DAYS to the archive tables, a batch per run so no
+    run holds its locks for long. Every run queues the next one until the pass is done.
+    """
+
+    def run(self, cutoff=None):
+        if cutoff is None:
+            cutoff = now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+            start_archive(cutoff)
+        else:
+            cutoff = parse_datetime(cutoff)
+
+        if archive_shipments(cutoff, settings.ARCHIVE_BATCH_SIZE):
+            ArchiveShipments.apply_async(args=[cutoff.isoformat()])
+        elif Shipment.objects.filter(shipment_date__lt=cutoff).exists():
+            # every remaining shipment is locked by a sync right now.
+            ArchiveShipments.apply_async(args=[cutoff.isoformat()], countdown=60)
+
+
+class BumpShipmentsVersion(celery_app.Task):
+    def run(self, seller_id):
+        increment_shipments_version(seller_id)
 
 
 RefreshAccessToken = celery_app.register_task(RefreshAccessToken())
 RefreshAccessTokens = celery_app.register_task(RefreshAccessTokens())
+ArchiveShipments = celery_app.register_task(ArchiveShipments())
+BumpShipmentsVersion = celery_app.register_task(BumpShipmentsVersion())
@@ -0,0 +1,327 @@
+import contextvars
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import is_aware, make_aware, now
+from rest_framework.pagination import PageNumberPagination
+
+from boloo_shop.db_router import READ_PRIMARY_COOKIE, REPLICA_DB_ALIAS, replica_reads
+
+from .archive import ShipmentChain, archive_shipments, reads_archive, start_archive
+from .cache import bump_shipments_version
+from .filters import filter_shipments, parse_since
+from .models import ArchivedShipment, Seller, Shipment, ShipmentItem, Transport, UserData
+from .pagination import ShipmentCursorPagination
+
+
+def create_seller(**kwargs):
+    kwargs.setdefault("client_id", "client-%s" % Seller.objects.count())
+    return Seller.objects.create(
+        name="seller", client_secret="secret", access_token="token", token_expires_at=now(), **kwargs
+    )
+
+
+def create_shipment(seller, shipment_id, shipment_date=None, **kwargs):
+    transport = Transport.objects.create(
+        transport_id=shipment_id, transporter_code="TNT", track_and_trace="3S%s" % shipment_id
+    )
+    customer, _ = UserData.objects.get_or_create_by_hash(first_name="Jan", city="Utrecht")
+    return Shipment.objects.create(
+        seller=seller,
+        shipment_id=shipment_id,
+        pick_up_point=False,
+        shipment_date=shipment_date or now(),
+        transport=transport,
+        customer=customer,
+        **kwargs
+    )
+
+
+def create_item(shipment, suffix=""):
+    return ShipmentItem.objects.create(
+        shipment=shipment,
+        order_item_id="item-%s%s" % (shipment.shipment_id, suffix),
+        order_id="order-%s" % shipment.shipment_id,
+        order_date=shipment.shipment_date,
+        latest_delivery_date=shipment.shipment_date,
+        ean="ean-%s" % shipment.shipment_id,
+        title="title",
+        quantity=1,
+        offer_price="9.99",
+        offer_condition="NEW",
+        fulfilment_method="FBR",
+    )
+
+
+class ShipmentListingQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # the listing reads from the replica, these tests only fill the primary.
+        self.client.cookies[READ_PRIMARY_COOKIE] = "1"
+        self.seller = create_seller()
+        for shipment_id in range(1, 13):
+            shipment = create_shipment(self.seller, shipment_id, now() - timedelta(hours=shipment_id))
+            shipment.billing = shipment.customer
+            shipment.save()
+            create_item(shipment, "a")
+            create_item(shipment, "b")
+
+    def test_query_count_does_not_grow_with_the_page_size(self):
+        # the seller, the archive checkpoint, the count, the shipments with their transport, customer &
+        # billing details and the items of the page.
+        for page_size in (5, 10):
+            cache.clear()
+            with mock.patch.object(PageNumberPagination, "page_size", page_size):
+                with self.assertNumQueries(5):
+                    response = self.client.get("/sellers/%s/shipments/" % self.seller.id)
+
+            results = response.json()["results"]
+            self.assertEqual(len(results), page_size)
+            self.assertEqual(len(results[0]["shipmentItems"]), 2)
+            self.assertEqual(results[0]["transport"]["trackAndTrace"], "3S1")
+            self.assertEqual(results[0]["billingDetails"]["city"], "Utrecht")
+
+
+class ShipmentPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.cookies[READ_PRIMARY_COOKIE] = "1"
+        self.seller = create_seller()
+        self.shipment = create_shipment(self.seller, 1)
+        self.url = "/sellers/%s/shipments/" % self.seller.id
+
+    def references(self, response):
+        return [shipment["shipmentReference"] for shipment in response.json()["results"]]
+
+    def test_unchanged_page_is_answered_with_304(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+
+        # only the seller is read.
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], etag)
+        # the ETag belongs to the page & filters of its url.
+        filtered = self.client.get(self.url, {"fulfilment_method": "FBR"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(filtered.status_code, 200)
+
+    def test_version_bump_invalidates_cached_pages(self):
+        etag = self.client.get(self.url)["ETag"]
+        Shipment.objects.filter(id=self.shipment.id).update(shipment_reference="changed")
+
+        # until the version is bumped the page is served from the cache.
+        self.assertEqual(self.references(self.client.get(self.url)), [""])
+
+        bump_shipments_version(self.seller.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self.references(response), ["changed"])
+
+
+class FieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.cookies[READ_PRIMARY_COOKIE] = "1"
+        self.seller = create_seller()
+        create_item(create_shipment(self.seller, 1))
+        self.url = "/sellers/%s/shipments/" % self.seller.id
+
+    def shipment_query(self, queries):
+        (sql,) = [
+            query["sql"]
+            for query in queries
+            if 'FROM "shipments_shipment"' in query["sql"] and "COUNT(" not in query["sql"]
+        ]
+        return sql
+
+    def test_fields_narrow_the_select(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"fields": "shipmentId,transport.trackAndTrace"})
+
+        self.assertEqual(
+            response.json()["results"], [{"shipmentId": 1, "transport": {"trackAndTrace": "3S1"}}]
+        )
+        sql = self.shipment_query(queries)
+        self.assertIn('"shipments_transport"."track_and_trace"', sql)
+        for column in ("shipment_reference", "transporter_code", "customer_id", "billing_id"):
+            self.assertNotIn(column, sql)
+        self.assertFalse([query for query in queries if "shipments_shipmentitem" in query["sql"]])
+        self.assertFalse([query for query in queries if "shipments_userdata" in query["sql"]])
+
+    def test_expand_loads_whole_relations(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"fields": "shipmentId", "expand": "shipmentItems"})
+
+        (shipment,) = response.json()["results"]
+        self.assertEqual(set(shipment), {"shipmentId", "shipmentItems"})
+        self.assertEqual(shipment["shipmentItems"][0]["ean"], "ean-1")
+        self.assertNotIn("shipments_transport", self.shipment_query(queries))
+
+    def test_unknown_fields_are_rejected(self):
+        for param, value in (
+            ("fields", "shipmentId,nope"),
+            ("fields", "transport.nope"),
+            ("fields", "shipmentId.nope"),
+            ("expand", "shipmentId"),
+        ):
+            response = self.client.get(self.url, {param: value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn(param, response.json())
+
+
+class UpsertTests(TestCase):
+    databases = {"default", REPLICA_DB_ALIAS}
+
+    def test_upsert_writes_to_the_primary_inside_replica_reads(self):
+        seller = create_seller()
+        shipment = Shipment(seller=seller, shipment_id=1, pick_up_point=False, shipment_date=now())
+
+        def upsert():
+            with replica_reads():
+                Shipment.objects.upsert([shipment])
+
+        # a fresh context, like a request which hasn't written yet.
+        contextvars.Context().run(upsert)
+
+        self.assertTrue(Shipment.objects.using("default").filter(seller=seller, shipment_id=1).exists())
+
+
+def index_name(model, fields):
+    return next(index.name for index in model._meta.indexes if index.fields == fields)
+
+
+class FilterIndexTests(TestCase):
+    """Every listing filter is answered from its index, on the shipments & the archive alike."""
+
+    def setUp(self):
+        self.seller = create_seller()
+
+    def assertFilterUsesIndex(self, params, fields, relation=None):
+        for shipments in (self.seller.shipments, self.seller.archived_shipments):
+            model = shipments.model
+            if relation:
+                model = model._meta.get_field(relation).related_model
+            with self.subTest(model=model.__name__):
+                plan = filter_shipments(shipments.all(), params).explain()
+                self.assertIn(index_name(model, fields), plan)
+
+    def test_shipment_date_after(self):
+        self.assertFilterUsesIndex({"shipment_date_after": "2020-01-01"}, ["seller", "shipment_date", "id"])
+
+    def test_shipment_date_before(self):
+        self.assertFilterUsesIndex({"shipment_date_before": "2020-01-01"}, ["seller", "shipment_date", "id"])
+
+    def test_track_and_trace(self):
+        self.assertFilterUsesIndex({"track_and_trace": "3S1"}, ["track_and_trace"], "transport")
+
+    def test_ean(self):
+        self.assertFilterUsesIndex({"ean": "8712626055150"}, ["ean", "shipment"], "items")
+
+    def test_order_id(self):
+        self.assertFilterUsesIndex({"order_id": "4123456789"}, ["order_id", "shipment"], "items")
+
+    def test_fulfilment_method(self):
+        self.assertFilterUsesIndex({"fulfilment_method": "FBR"}, ["shipment", "fulfilment_method"], "items")
+
+
+class ParseSinceTests(TestCase):
+    def test_naive_datetime_is_made_aware(self):
+        since = parse_since("2019-01-01T00:00:00")
+        self.assertTrue(is_aware(since))
+        self.assertEqual(since, make_aware(datetime(2019, 1, 1)))
+
+    def test_date_and_offset_datetime(self):
+        self.assertEqual(parse_since("2019-01-01"), make_aware(datetime(2019, 1, 1)))
+        self.assertEqual(parse_since("2019-01-01T00:00:00+00:00").utcoffset(), timedelta(0))
+
+    def test_naive_datetime_is_compared_with_the_archive_checkpoint(self):
+        start_archive(make_aware(datetime(2020, 1, 1)))
+
+        self.assertTrue(reads_archive({"shipment_date_after": "2019-01-01T00:00:00"}))
+        self.assertFalse(reads_archive({"shipment_date_after": "2020-06-01T00:00:00"}))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # the listing reads from the replica, these tests only fill the primary.
+        self.client.cookies[READ_PRIMARY_COOKIE] = "1"
+        self.seller = create_seller()
+        for shipment_id in range(1, 7):
+            # 1-3 are recent, 4-6 older than the cutoff.
+            days = shipment_id if shipment_id <= 3 else 400 + shipment_id
+            create_item(create_shipment(self.seller, shipment_id, now() - timedelta(days=days)))
+
+        cutoff = now() - timedelta(days=365)
+        start_archive(cutoff)
+        self.assertEqual(archive_shipments(cutoff, batch_size=10), 3)
+
+    def shipment_ids(self, response):
+        return [shipment["shipmentId"] for shipment in response.json()["results"]]
+
+    def test_listing_includes_archived_shipments(self):
+        self.assertEqual(ArchivedShipment.objects.count(), 3)
+        response = self.client.get("/sellers/%s/shipments/" % self.seller.id)
+        self.assertEqual(response.json()["count"], 6)
+        self.assertEqual(self.shipment_ids(response), [1, 2, 3, 4, 5, 6])
+
+    def test_pages_before_the_archive_do_not_count_it(self):
+        url = "/sellers/%s/shipments/" % self.seller.id
+        with mock.patch.object(PageNumberPagination, "page_size", 2):
+            with CaptureQueriesContext(connection) as queries:
+                first_page = self.client.get(url)
+            second_page = self.client.get(first_page.json()["next"])
+
+        self.assertEqual(self.shipment_ids(first_page), [1, 2])
+        self.assertEqual(first_page.json()["count"], 3)
+        self.assertFalse([query for query in queries if "archivedshipment" in query["sql"]])
+        self.assertEqual(self.shipment_ids(second_page), [3, 4])
+        self.assertEqual(second_page.json()["count"], 6)
+
+    def test_cursor_walks_into_the_archive(self):
+        shipment_ids = []
+        url = "/sellers/%s/shipments/?pagination=cursor" % self.seller.id
+        with mock.patch.object(ShipmentCursorPagination, "page_size", 2):
+            while url:
+                response = self.client.get(url)
+                shipment_ids += self.shipment_ids(response)
+                url = response.json()["next"]
+            previous = self.client.get(response.json()["previous"])
+        self.assertEqual(shipment_ids, [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.shipment_ids(previous), [3, 4])
+
+    def test_lookups_find_archived_shipments(self):
+        for param, value in (("ean", "ean-5"), ("order_id", "order-5"), ("track_and_trace", "3S5")):
+            response = self.client.get("/sellers/%s/shipments/" % self.seller.id, {param: value})
+            self.assertEqual(self.shipment_ids(response), [5], param)
+
+    def test_listing_after_the_checkpoint_skips_the_archive(self):
+        after = (now() - timedelta(days=10)).date().isoformat()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/sellers/%s/shipments/" % self.seller.id, {"shipment_date_after": after}
+            )
+        self.assertEqual(self.shipment_ids(response), [1, 2, 3])
+        self.assertFalse([query for query in queries if "archivedshipment" in query["sql"]])
+
+    def test_chain_slices_across_querysets(self):
+        chain = ShipmentChain(
+            [self.seller.shipments.order_by("-shipment_date"), self.seller.archived_shipments.all()]
+        )
+        self.assertEqual(chain.count(), 6)
+        self.assertEqual([shipment.shipment_id for shipment in chain[2:5]], [3, 4, 5])
+        self.assertEqual([shipment.shipment_id for shipment in chain[4:10]], [5, 6])
+        oldest_first = chain.order_by("shipment_date")
+        self.assertEqual([shipment.shipment_id for shipment in oldest_first[:4]], [6, 5, 4, 3])
+
+    def test_export_includes_archived_shipments(self):
+        response = self.client.get("/sellers/%s/export/" % self.seller.id)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(json.loads(line)["shipmentId"] for line in lines), [1, 2, 3, 4, 5, 6])
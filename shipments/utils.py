@@ -1,19 +1,23 @@
 import base64
 from datetime import timedelta
 
-import requests
-from requests.exceptions import HTTPError
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.timezone import now
 
+from boloo_shop import bol
+from sync import constants
+
 
 class AccessToken:
-    URL = "https://login.bol.com/token?grant_type=client_credentials"
+    URL = constants.BOL_AUTH_URL
 
     @staticmethod
     def fetch(client_id, client_secret):
         encoded_credentials = base64.b64encode(bytes("%s:%s" % (client_id, client_secret), encoding="utf8"))
-        response = requests.post(
+        response = bol.post(
             url=AccessToken.URL,
+            end_point_name=constants.TOKEN_ENDPOINT_NAME,
             headers={
                 "Accept": "application/json",
                 "Authorization": "Basic %s" % encoded_credentials.decode(),
@@ -32,3 +36,34 @@ class AccessToken:
         seller_instance.access_token = data["access_token"]
         seller_instance.token_expires_at = now() + timedelta(seconds=int(data["expires_in"]))
         seller_instance.save()
+        AccessToken.cache(seller_instance.id, seller_instance.access_token, seller_instance.token_expires_at)
+
+    @staticmethod
+    def cache_key(seller_id):
+        return "access_token:%s" % seller_id
+
+    @staticmethod
+    def cache(seller_id, access_token, token_expires_at):
+        timeout = min(settings.TOKEN_CACHE_TIMEOUT, int((token_expires_at - now()).total_seconds()))
+        if timeout > 0:
+            cache.set(AccessToken.cache_key(seller_id), access_token, timeout=timeout)
+        else:
+            AccessToken.invalidate(seller_id)
+
+    @staticmethod
+    def invalidate(seller_id):
+        cache.delete(AccessToken.cache_key(seller_id))
+
+    @staticmethod
+    def get(seller_id):
+        """Returns the seller's access token, only reading the seller when it isn't cached."""
+        from .models import Seller
+
+        access_token = cache.get(AccessToken.cache_key(seller_id))
+        if access_token is None:
+            access_token, token_expires_at = Seller.objects.values_list(
+                "access_token", "token_expires_at"
+            ).get(id=seller_id)
+            AccessToken.cache(seller_id, access_token, token_expires_at)
+
+        return access_token
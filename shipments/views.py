@@ -1,54 +1,137 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from django.utils.timezone import now
 from django_celery_beat.models import IntervalSchedule, PeriodicTask
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.generics import CreateAPIView 
+from boloo_shop.db_router import replica_reads
 from sync import constants
-from sync.models import SellerEndPointTracker
+from sync.models import SellerEndPointTracker, SellerSyncStatus
+from sync.scheduler import schedule_dispatch
 
+from .archive import ShipmentChain, reads_archive
+from .cache import get_shipments_page, set_shipments_page, shipments_etag, shipments_version
+from .export import csv_rows, ndjson_rows
+from .fieldsets import fieldset_queryset, parse_fieldset
+from .filters import filter_shipments, parse_since
 from .models import Seller
-from .serializers import SellerSerializer, ShipmentSerializer
+from .pagination import ShipmentCursorPagination, ShipmentPageNumberPagination
+from .serializers import SellerSerializer, SellerSyncStatusSerializer, ShipmentSerializer
 
 
 class SellerViewSet(viewsets.ModelViewSet):
     serializer_class = SellerSerializer
     queryset = Seller.objects.all()
+    # read only actions served from the replica when there is one.
+    replica_actions = {"list", "retrieve", "shipments"}
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(self.action_map.get(request.method.lower()) in self.replica_actions):
+            return super().dispatch(request, *args, **kwargs)
 
     @action(detail=True, methods=["post"])
     def sync(self, request, *args, **kwargs):
         seller = self.get_object()
 
-        _, shipment_sync_created = SellerEndPointTracker.objects.get_or_create(
+        list_end_point, shipment_sync_created = SellerEndPointTracker.objects.get_or_create(
             seller=seller,
             end_point_name=constants.SHIPMENT_LIST_ENDPOINT_NAME,
-            defaults={"remaining_req_limit": 7, "limit_reset_at": now()},
+            defaults={"remaining_req_limit": constants.SHIPMENT_LIST_RATE_LIMIT, "limit_reset_at": now()},
         )
-        SellerEndPointTracker.objects.get_or_create(
+        detail_end_point, _ = SellerEndPointTracker.objects.get_or_create(
             seller=seller,
             end_point_name=constants.SHIPMENT_DETAIL_ENDPOINT_NAME,
-            defaults={"remaining_req_limit": 14, "limit_reset_at": now()},
+            defaults={"remaining_req_limit": constants.SHIPMENT_DETAIL_RATE_LIMIT, "limit_reset_at": now()},
+        )
+        # runs queue their own successors, beat only sweeps for sellers which dropped out.
+        sweep_schedule, _ = IntervalSchedule.objects.get_or_create(
+            every=settings.SYNC_SWEEP_MINUTES, period=IntervalSchedule.MINUTES
+        )
+        PeriodicTask.objects.update_or_create(
+            name="Sync End Points", defaults={"interval": sweep_schedule, "task": "sync.tasks.SyncEndPoints"}
         )
         schedule, _ = IntervalSchedule.objects.get_or_create(every=1, period=IntervalSchedule.MINUTES)
         PeriodicTask.objects.get_or_create(
-            interval=schedule, name="Sync End Points", task="sync.tasks.SyncEndPoints"
+            interval=schedule, name="Reap Shipment Leases", task="sync.tasks.ReapShipmentLeases"
         )
+        daily_schedule, _ = IntervalSchedule.objects.get_or_create(every=1, period=IntervalSchedule.DAYS)
+        PeriodicTask.objects.get_or_create(
+            interval=daily_schedule, name="Archive Shipments", task="shipments.tasks.ArchiveShipments"
+        )
+        schedule_dispatch(list_end_point)
+        schedule_dispatch(detail_end_point)
 
         if shipment_sync_created:
-            return Response({"message": "Shipments Sync Will Start within 1 minute."})
+            return Response({"message": "Shipments Sync Started."})
 
-        return Response({"message": "Shipments Sync already started. Please wait for 1 minute"})
+        return Response({"message": "Shipments Sync already started."})
+
+    @action(detail=True, methods=["get"], url_path="sync-status")
+    def sync_status(self, request, *args, **kwargs):
+        seller = self.get_object()
+        sync_status = SellerSyncStatus.objects.filter(seller=seller).first()
+        end_point_trackers = SellerEndPointTracker.objects.filter(seller=seller).order_by("id")
+        serializer = SellerSyncStatusSerializer(
+            sync_status or SellerSyncStatus(seller=seller), context={"end_point_trackers": end_point_trackers}
+        )
+        return Response(serializer.data)
 
     @action(detail=True, methods=["get"])
     def shipments(self, request, *args, **kwargs):
         seller = self.get_object()
-        queryset = seller.shipments.all()
+        version = shipments_version(seller.id)
+        etag = shipments_etag(seller.id, version, request)
+
+        if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        data = get_shipments_page(seller.id, version, request)
+        if data is None:
+            data = self.get_shipments_data(request, seller)
+            set_shipments_page(seller.id, version, request, data)
+
+        return Response(data, headers={"ETag": etag})
+
+    def get_shipments_data(self, request, seller):
+        fieldset = parse_fieldset(request.query_params)
+        managers = [seller.shipments]
+        if reads_archive(request.query_params):
+            managers.append(seller.archived_shipments)
+        queryset = ShipmentChain(
+            filter_shipments(fieldset_queryset(shipments, fieldset), request.query_params)
+            for shipments in managers
+        )
+
+        if "cursor" in request.query_params or request.query_params.get("pagination") == "cursor":
+            self.pagination_class = ShipmentCursorPagination
+        else:
+            self.pagination_class = ShipmentPageNumberPagination
 
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = ShipmentSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            serializer = ShipmentSerializer(page, many=True, fieldset=fieldset)
+            return self.get_paginated_response(serializer.data).data
 
-        serializer = ShipmentSerializer(queryset, many=True)
-        return Response(serializer.data)
+        serializer = ShipmentSerializer(queryset, many=True, fieldset=fieldset)
+        return serializer.data
+
+    @action(detail=True, methods=["get"])
+    def export(self, request, *args, **kwargs):
+        seller = self.get_object()
+        querysets = [seller.shipments.all(), seller.archived_shipments.all()]
+
+        since = request.query_params.get("since")
+        if since:
+            since = parse_since(since)
+            querysets = [queryset.filter(shipment_date__gte=since) for queryset in querysets]
+
+        if request.query_params.get("type", "ndjson") == "csv":
+            response = StreamingHttpResponse(csv_rows(querysets), content_type="text/csv")
+            response["Content-Disposition"] = 'attachment; filename="seller-%s-shipments.csv"' % seller.id
+            return response
+
+        return StreamingHttpResponse(ndjson_rows(querysets), content_type="application/x-ndjson")
@@ -1,10 +1,29 @@
+import os
+
 FBR ="FBR"
 FBB = "FBB"
 FULFILMENT_METHODS = [FBR, FBB]
 
-BOL_AUTH_URL = "https://login.bol.com/token?grant_type=client_credentials"
-SHIPMENTS_URL = "https://api.bol.com/retailer/shipments/"
-SHIPMENT_URL = "https://api.bol.com/retailer/shipments/{}"
+# overridable so the sync can run against a local bol.com stand-in (see benchmarks/).
+BOL_LOGIN_URL = os.environ.get("BOL_LOGIN_URL", "https://login.bol.com")
+BOL_API_URL = os.environ.get("BOL_API_URL", "https://api.bol.com")
+
+BOL_AUTH_URL = BOL_LOGIN_URL + "/token?grant_type=client_credentials"
+SHIPMENTS_URL = BOL_API_URL + "/retailer/shipments/"
+SHIPMENT_URL = BOL_API_URL + "/retailer/shipments/{}"
 
+TOKEN_ENDPOINT_NAME = "token"
 SHIPMENT_LIST_ENDPOINT_NAME = "shipment_list"
-SHIPMENT_DETAIL_ENDPOINT_NAME = "shipment_detail"
\ No newline at end of file
+SHIPMENT_DETAIL_ENDPOINT_NAME = "shipment_detail"
+
+# bol.com request limits per end point & window (seconds) used until their headers tell otherwise.
+SHIPMENT_LIST_RATE_LIMIT = 7
+SHIPMENT_DETAIL_RATE_LIMIT = 14
+RATE_LIMITS = {
+    SHIPMENT_LIST_ENDPOINT_NAME: SHIPMENT_LIST_RATE_LIMIT,
+    SHIPMENT_DETAIL_ENDPOINT_NAME: SHIPMENT_DETAIL_RATE_LIMIT,
+}
+RATE_LIMIT_WINDOW = 60
+
+# seconds to wait for a rejected access token to be refreshed before retrying.
+TOKEN_REFRESH_RETRY_DELAY = 5
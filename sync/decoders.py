@@ -0,0 +1,180 @@
+import re
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import models
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_aware, make_aware
+
+from shipments.models import Shipment, ShipmentItem, Transport, UserData
+
+from .exceptons import ShipmentDecodeError
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover
+    import json
+
+    loads = json.loads
+
+
+def camelize(field_name):
+    first, *rest = field_name.split("_")
+    return first + "".join(part.capitalize() for part in rest)
+
+
+def to_datetime(value):
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError("invalid datetime")
+    return parsed if is_aware(parsed) else make_aware(parsed)
+
+
+# like rest_framework's IntegerField, "1.0" & 1.0 are integers but 1.9 & True aren't.
+INTEGRAL_DECIMAL = re.compile(r"\.0*\s*$")
+
+
+def is_scalar(value):
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def to_int(value):
+    try:
+        if not is_scalar(value):
+            raise ValueError
+        return int(INTEGRAL_DECIMAL.sub("", str(value)))
+    except ValueError:
+        raise ValueError("invalid integer")
+
+
+def to_bool(value):
+    if not isinstance(value, bool):
+        raise ValueError("invalid boolean")
+    return value
+
+
+class Field:
+    def __init__(self, model_field):
+        self.name = model_field.attname
+        self.required = not (model_field.blank or model_field.null or model_field.has_default())
+        self.model_field = model_field
+
+        if isinstance(model_field, models.DateTimeField):
+            self.convert = to_datetime
+        elif isinstance(model_field, models.DecimalField):
+            self.convert = self.to_decimal
+        elif isinstance(model_field, models.BooleanField):
+            self.convert = to_bool
+        elif isinstance(model_field, models.IntegerField):
+            self.convert = to_int
+        elif isinstance(model_field, models.EmailField):
+            self.convert = self.to_email
+        else:
+            self.convert = self.to_str
+
+    def to_str(self, value):
+        # the rules of the rest_framework CharField the shipments were validated with before.
+        if not is_scalar(value):
+            raise ValueError("not a valid string")
+        value = str(value).strip()
+        if not value and not self.model_field.blank:
+            raise ValueError("may not be blank")
+        if self.model_field.max_length and len(value) > self.model_field.max_length:
+            raise ValueError("longer than %s characters" % self.model_field.max_length)
+        return value
+
+    def to_email(self, value):
+        value = self.to_str(value)
+        if value:
+            try:
+                validate_email(value)
+            except ValidationError:
+                raise ValueError("invalid email address")
+        return value
+
+    def to_decimal(self, value):
+        try:
+            value = Decimal(str(value)) if is_scalar(value) else Decimal("NaN")
+            if not value.is_finite():
+                raise InvalidOperation
+            value = value.quantize(Decimal(1).scaleb(-self.model_field.decimal_places))
+        except InvalidOperation:
+            raise ValueError("invalid decimal")
+        if len(value.as_tuple().digits) > self.model_field.max_digits:
+            raise ValueError("more than %s digits" % self.model_field.max_digits)
+        return value
+
+
+class Schema:
+    """
+    camelCase key to model field table of a model, built once from its concrete fields.
+    Relations & the excluded fields are decoded by the caller.
+    """
+
+    def __init__(self, model, exclude=()):
+        self.model = model
+        self.fields = {
+            camelize(field.name): Field(field)
+            for field in model._meta.concrete_fields
+            if not field.primary_key and not field.is_relation and field.name not in exclude
+        }
+
+    def decode(self, data, path):
+        if not isinstance(data, dict):
+            raise ShipmentDecodeError("%s: expected an object" % path)
+
+        values = {}
+        for key, field in self.fields.items():
+            value = data.get(key)
+            if value is None:
+                if field.required:
+                    raise ShipmentDecodeError("%s.%s: this field is required" % (path, key))
+                continue
+            try:
+                values[field.name] = field.convert(value)
+            except (TypeError, ValueError) as e:
+                raise ShipmentDecodeError("%s.%s: %s" % (path, key, e))
+        return values
+
+
+SHIPMENT_SCHEMA = Schema(Shipment)
+SHIPMENT_ITEM_SCHEMA = Schema(ShipmentItem)
+TRANSPORT_SCHEMA = Schema(Transport)
+USER_DATA_SCHEMA = Schema(UserData, exclude=["content_hash"])
+
+
+ParsedShipment = namedtuple("ParsedShipment", ["shipment", "transport", "customer", "billing", "items"])
+
+
+def decode_user_data(data, path):
+    values = UserData.normalize(USER_DATA_SCHEMA.decode(data, path))
+    return UserData(content_hash=UserData.compute_hash(values), **values)
+
+
+def decode_shipment(content, seller_id):
+    """Decodes the raw bytes of a bol.com shipment detail response, see ShipmentSerializer for the API."""
+    try:
+        data = loads(content)
+    except ValueError as e:
+        raise ShipmentDecodeError("invalid JSON: %s" % e)
+
+    shipment = Shipment(seller_id=seller_id, **SHIPMENT_SCHEMA.decode(data, "shipment"))
+
+    if not isinstance(data.get("shipmentItems"), list):
+        raise ShipmentDecodeError("shipment.shipmentItems: expected a list")
+    items = [
+        ShipmentItem(**SHIPMENT_ITEM_SCHEMA.decode(item, "shipment.shipmentItems[%s]" % index))
+        for index, item in enumerate(data["shipmentItems"])
+    ]
+
+    transport = Transport(**TRANSPORT_SCHEMA.decode(data.get("transport"), "shipment.transport"))
+    customer = decode_user_data(data.get("customerDetails"), "shipment.customerDetails")
+    billing = None
+    if data.get("billingDetails"):
+        billing = decode_user_data(data["billingDetails"], "shipment.billingDetails")
+
+    return ParsedShipment(shipment, transport, customer, billing, items)
@@ -1,2 +1,6 @@
 class SyncCompletedError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class ShipmentDecodeError(ValueError):
+    pass
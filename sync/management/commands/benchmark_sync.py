@@ -0,0 +1,68 @@
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.fake_bol import FakeBol
+from benchmarks.runner import run
+from sync import constants
+
+
+class Command(BaseCommand):
+    help = (
+        "Syncs seeded sellers end to end against a local bol.com stand-in and reports throughput. "
+        "BOL_API_URL & BOL_LOGIN_URL must point at the stand-in, e.g. http://127.0.0.1:8765, "
+        "for this process and, with --mode=workers, for the celery workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sellers", type=int, default=5)
+        parser.add_argument("--shipments", type=int, default=200, help="Shipments per seller.")
+        parser.add_argument(
+            "--mode",
+            choices=["local", "workers"],
+            default="local",
+            help="local runs the tasks in a worker thread of this process, workers the configured broker.",
+        )
+        parser.add_argument("--concurrency", type=int, default=1, help="Worker threads in local mode.")
+        parser.add_argument("--latency", type=float, default=0.05, help="Seconds per stand-in request.")
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--list-limit", type=int, default=constants.SHIPMENT_LIST_RATE_LIMIT)
+        parser.add_argument("--detail-limit", type=int, default=constants.SHIPMENT_DETAIL_RATE_LIMIT)
+        parser.add_argument("--window", type=int, default=constants.RATE_LIMIT_WINDOW)
+        parser.add_argument("--tick", type=float, default=1.0, help="Seconds between SyncEndPoints runs.")
+        parser.add_argument("--timeout", type=float, default=600)
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded sellers & shipments.")
+
+    def handle(self, *args, **options):
+        api_url, login_url = urlparse(constants.BOL_API_URL), urlparse(constants.BOL_LOGIN_URL)
+        if api_url.hostname not in ("127.0.0.1", "localhost") or api_url.netloc != login_url.netloc:
+            raise CommandError("BOL_API_URL and BOL_LOGIN_URL must both point at the local stand-in.")
+
+        fake_bol = FakeBol(
+            host=api_url.hostname,
+            port=api_url.port or 80,
+            latency=options["latency"],
+            page_size=options["page_size"],
+            list_limit=options["list_limit"],
+            detail_limit=options["detail_limit"],
+            window=options["window"],
+        ).start()
+
+        try:
+            report = run(
+                fake_bol,
+                options["sellers"],
+                options["shipments"],
+                mode=options["mode"],
+                concurrency=options["concurrency"],
+                tick=options["tick"],
+                timeout=options["timeout"],
+                keep=options["keep"],
+            )
+        finally:
+            fake_bol.stop()
+
+        for name, value in report.items():
+            if isinstance(value, float):
+                value = "%.2f" % value
+            self.stdout.write("%-24s %s" % (name, "n/a" if value is None else value))
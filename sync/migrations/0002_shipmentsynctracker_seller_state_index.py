@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shipmentsynctracker',
+            index=models.Index(fields=['seller', 'state'], name='sync_shipme_seller__dbb6d5_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0002_shipmentsynctracker_seller_state_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentsynctracker',
+            name='lease_expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='shipmentsynctracker',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentsynctracker',
+            index=models.Index(fields=['state', 'lease_expires_at'], name='sync_shipme_state_dc23f8_idx'),
+        ),
+    ]
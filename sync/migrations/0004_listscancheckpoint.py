@@ -0,0 +1,29 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0003_userdata_content_hash'),
+        ('sync', '0003_shipmentsynctracker_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListScanCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fulfilment_method', models.CharField(max_length=3)),
+                ('page', models.IntegerField(default=1)),
+                ('high_water_shipment_id', models.CharField(blank=True, max_length=255)),
+                ('scan_high_water_shipment_id', models.CharField(blank=True, max_length=255)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='list_scan_checkpoints', to='shipments.Seller')),
+            ],
+            options={
+                'unique_together': {('seller', 'fulfilment_method')},
+            },
+        ),
+    ]
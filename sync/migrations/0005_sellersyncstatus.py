@@ -0,0 +1,52 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+COUNTERS = {"Not Started": "pending", "Started": "in_flight", "Finished": "finished", "Failed": "failed"}
+
+
+def count_trackers(apps, schema_editor):
+    ShipmentSyncTracker = apps.get_model("sync", "ShipmentSyncTracker")
+    SellerSyncStatus = apps.get_model("sync", "SellerSyncStatus")
+
+    statuses = {}
+    counts = (
+        ShipmentSyncTracker.objects.order_by().values_list("seller_id", "state").annotate(count=Count("id"))
+    )
+    for seller_id, state, count in counts:
+        status = statuses.setdefault(seller_id, SellerSyncStatus(seller_id=seller_id))
+        setattr(status, COUNTERS[state], count)
+        status.discovered += count
+    SellerSyncStatus.objects.bulk_create(statuses.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipments', '0004_shipment_unique_seller_shipment_id'),
+        ('sync', '0004_listscancheckpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shipmentsynctracker',
+            name='state',
+            field=models.CharField(choices=[('Not Started', 'Not Started'), ('Started', 'Started'), ('Finished', 'Finished'), ('Failed', 'Failed')], default='Not Started', max_length=15),
+        ),
+        migrations.CreateModel(
+            name='SellerSyncStatus',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discovered', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('in_flight', models.IntegerField(default=0)),
+                ('finished', models.IntegerField(default=0)),
+                ('failed', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sync_status', to='shipments.Seller')),
+            ],
+        ),
+        migrations.RunPython(count_trackers, migrations.RunPython.noop),
+    ]
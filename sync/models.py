@@ -1,5 +1,9 @@
-from django.db import models
-from django.db.models import Q
+import math
+from collections import Counter
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.utils.timezone import now
 
 from . import constants
@@ -10,6 +14,123 @@ class SellerEndPointTrackerManager(models.Manager):
         return self.filter(Q(limit_reset_at__lte=now()) | Q(remaining_req_limit__gt=0))
 
 
+class ShipmentSyncTrackerManager(models.Manager):
+    def track(self, seller_id, shipment_ids):
+        """Start tracking a page of shipment ids, returns the ids which were already tracked."""
+        shipment_ids = [str(shipment_id) for shipment_id in shipment_ids]
+        with transaction.atomic():
+            # serialises the seller's track calls, so the counters only grow by the rows inserted here.
+            SellerSyncStatus.objects.lock(seller_id)
+            trackers = self.filter(seller_id=seller_id, shipment_id__in=shipment_ids)
+            existing_ids = set(trackers.values_list("shipment_id", flat=True))
+            self.bulk_create(
+                [
+                    self.model(seller_id=seller_id, shipment_id=shipment_id)
+                    for shipment_id in shipment_ids
+                    if shipment_id not in existing_ids
+                ],
+                ignore_conflicts=True,
+            )
+            inserted = trackers.count() - len(existing_ids)
+            SellerSyncStatus.objects.adjust(seller_id, discovered=inserted, pending=inserted)
+        return existing_ids
+
+    def pending_ids(self, seller_id):
+        return self.filter(seller_id=seller_id, state=self.model.NOT_STARTED).order_by("id").values_list(
+            "id", flat=True
+        )
+
+    def transition(self, queryset, state, **changes):
+        """
+        Moves the trackers of queryset to state & keeps the sellers' counters in step, the sellers'
+        status rows & the trackers are locked until the counters are updated. Returns the number of
+        moved trackers.
+        """
+        with transaction.atomic():
+            # status rows before trackers, in the order of track & claim, so they can't deadlock.
+            seller_ids = list(queryset.order_by("seller_id").values_list("seller_id", flat=True).distinct())
+            for seller_id in seller_ids:
+                SellerSyncStatus.objects.lock(seller_id)
+            rows = list(
+                queryset.filter(seller_id__in=seller_ids)
+                .select_for_update()
+                .values_list("id", "seller_id", "state")
+            )
+            self.filter(id__in=[tracker_id for tracker_id, _, _ in rows]).update(state=state, **changes)
+
+            moves = Counter((seller_id, old_state) for _, seller_id, old_state in rows if old_state != state)
+            for (seller_id, old_state), count in moves.items():
+                SellerSyncStatus.objects.adjust(
+                    seller_id, **{self.model.COUNTERS[old_state]: -count, self.model.COUNTERS[state]: count}
+                )
+        return len(rows)
+
+    def claim(self, seller_id, limit, lease_owner, lease_seconds):
+        """
+        Leases up to limit pending trackers of a seller to lease_owner, rows locked by a concurrent
+        claim are skipped so no tracker is handed out twice. Returns the leased ids.
+        """
+        with transaction.atomic():
+            SellerSyncStatus.objects.lock(seller_id)
+            tracker_ids = list(self.pending_ids(seller_id).select_for_update(skip_locked=True)[:limit])
+            self.lease(self.filter(id__in=tracker_ids), lease_owner, lease_seconds)
+        return tracker_ids
+
+    def lease(self, queryset, lease_owner, lease_seconds):
+        return self.transition(
+            queryset.filter(state=self.model.NOT_STARTED),
+            self.model.STARTED,
+            lease_owner=lease_owner,
+            lease_expires_at=now() + timedelta(seconds=lease_seconds),
+        )
+
+    def leased(self, tracker_ids, lease_owner):
+        return self.filter(id__in=tracker_ids, state=self.model.STARTED, lease_owner=lease_owner)
+
+    def finish(self, tracker_ids, lease_owner):
+        return self.transition(
+            self.leased(tracker_ids, lease_owner), self.model.FINISHED, lease_owner="", lease_expires_at=None
+        )
+
+    def fail(self, tracker_ids, lease_owner):
+        """For shipments bol.com won't give us, retrying them would only waste the detail budget."""
+        return self.transition(
+            self.leased(tracker_ids, lease_owner), self.model.FAILED, lease_owner="", lease_expires_at=None
+        )
+
+    def release(self, tracker_ids, lease_owner):
+        return self.transition(
+            self.leased(tracker_ids, lease_owner),
+            self.model.NOT_STARTED,
+            lease_owner="",
+            lease_expires_at=None,
+        )
+
+    def reap(self):
+        """Returns trackers whose lease expired, e.g. because their worker died, to the queue."""
+        return self.transition(
+            self.filter(
+                Q(lease_expires_at__lt=now()) | Q(lease_expires_at__isnull=True), state=self.model.STARTED
+            ),
+            self.model.NOT_STARTED,
+            lease_owner="",
+            lease_expires_at=None,
+        )
+
+
+class SellerSyncStatusManager(models.Manager):
+    def lock(self, seller_id):
+        """Locks the seller's status row until the end of the transaction, creating it if needed."""
+        self.get_or_create(seller_id=seller_id)
+        return self.select_for_update().get(seller_id=seller_id)
+
+    def adjust(self, seller_id, **deltas):
+        deltas = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        if deltas and not self.filter(seller_id=seller_id).update(**deltas):
+            self.get_or_create(seller_id=seller_id)
+            self.filter(seller_id=seller_id).update(**deltas)
+
+
 class SellerEndPointTracker(models.Model):
     fulfilment_method_mapper = {
         constants.FBB: "initial_fbb_completed",
@@ -35,15 +156,91 @@ class ShipmentSyncTracker(models.Model):
     NOT_STARTED = "Not Started"
     STARTED = "Started"
     FINISHED = "Finished"
+    FAILED = "Failed"
 
     STATE_CHOICES = (
         (NOT_STARTED, "Not Started"),
         (STARTED, "Started"),
-        (FINISHED,"Finished")
+        (FINISHED,"Finished"),
+        (FAILED, "Failed"),
     )
+    # SellerSyncStatus counter of every state.
+    COUNTERS = {NOT_STARTED: "pending", STARTED: "in_flight", FINISHED: "finished", FAILED: "failed"}
 
     seller = models.ForeignKey(
         "shipments.seller", related_name="shipments_to_sync", on_delete=models.CASCADE
     )
     shipment_id = models.CharField(unique=True, max_length=255)
     state = models.CharField(max_length=15, choices=STATE_CHOICES, default=NOT_STARTED)
+    # trackers in the Started state are leased to a single detail task until lease_expires_at.
+    lease_owner = models.CharField(max_length=64, blank=True)
+    lease_expires_at = models.DateTimeField(null=True)
+    objects = ShipmentSyncTrackerManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["seller", "state"]),
+            models.Index(fields=["state", "lease_expires_at"]),
+        ]
+
+
+class ListScanCheckpoint(models.Model):
+    """
+    Where the shipments list scan of a seller & fulfilment method stands, so a failed scan resumes
+    from its page and incremental scans stop at the newest shipment seen by the last complete scan.
+    """
+
+    seller = models.ForeignKey(
+        "shipments.seller", related_name="list_scan_checkpoints", on_delete=models.CASCADE
+    )
+    fulfilment_method = models.CharField(max_length=3)
+    page = models.IntegerField(default=1)
+    high_water_shipment_id = models.CharField(max_length=255, blank=True)
+    # newest shipment of the running scan, only promoted to high water once the scan completes.
+    scan_high_water_shipment_id = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        unique_together = ("seller", "fulfilment_method")
+
+    def advance(self, page):
+        self.page = page
+        self.save(update_fields=["page", "scan_high_water_shipment_id"])
+
+    def complete(self):
+        self.high_water_shipment_id = self.scan_high_water_shipment_id or self.high_water_shipment_id
+        self.scan_high_water_shipment_id = ""
+        self.page = 1
+        self.save(update_fields=["page", "high_water_shipment_id", "scan_high_water_shipment_id"])
+
+
+class SellerSyncStatus(models.Model):
+    """
+    Running counts of a seller's shipment sync trackers, kept in step by ShipmentSyncTrackerManager
+    so the sync progress is read from one row.
+    """
+
+    seller = models.OneToOneField("shipments.seller", related_name="sync_status", on_delete=models.CASCADE)
+    discovered = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    in_flight = models.IntegerField(default=0)
+    finished = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = SellerSyncStatusManager()
+
+    def eta(self, detail_end_point_tracker):
+        """Estimates when the shipments discovered so far are synced, from the detail end point budget."""
+        backlog = self.pending + self.in_flight
+        if not backlog:
+            return None
+
+        window_starts_at = now()
+        if detail_end_point_tracker.limit_reset_at > now():
+            backlog -= detail_end_point_tracker.remaining_req_limit
+            window_starts_at = detail_end_point_tracker.limit_reset_at
+        if backlog <= 0:
+            return now()
+
+        windows = math.ceil(backlog / constants.SHIPMENT_DETAIL_RATE_LIMIT) - 1
+        return window_starts_at + timedelta(seconds=windows * constants.RATE_LIMIT_WINDOW)
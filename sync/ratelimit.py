@@ -0,0 +1,111 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from boloo_shop.metrics import RATE_LIMIT_TOKENS
+
+from . import constants
+from .models import SellerEndPointTracker
+
+
+def seconds_until(moment):
+    return max(math.ceil((moment - now()).total_seconds()), 1)
+
+
+class RateLimiter:
+    """
+    Token bucket per seller & end point shared by all workers through the cache.
+
+    The bucket is refilled when bol.com's window ends, until then its rate limit headers only lower
+    it. It is only flushed to the SellerEndPointTracker row every RATE_LIMIT_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self, end_point_tracker):
+        self.end_point_tracker = end_point_tracker
+        self.key = "ratelimit:%s:%s" % (end_point_tracker.seller_id, end_point_tracker.end_point_name)
+        self.reset_key = "%s:reset_at" % self.key
+        self.flush_key = "%s:flushed" % self.key
+
+    def seed(self):
+        if self.end_point_tracker.limit_reset_at > now():
+            remaining = self.end_point_tracker.remaining_req_limit
+            reset_in = seconds_until(self.end_point_tracker.limit_reset_at)
+        else:
+            remaining = constants.RATE_LIMITS[self.end_point_tracker.end_point_name]
+            reset_in = constants.RATE_LIMIT_WINDOW
+
+        if cache.add(self.key, remaining, timeout=reset_in):
+            cache.set(self.reset_key, now() + timedelta(seconds=reset_in), timeout=reset_in)
+
+    def acquire(self):
+        for _ in range(2):
+            self.seed()
+            try:
+                acquired = cache.decr(self.key) >= 0
+            except ValueError:
+                # bucket expired between seeding and taking a token.
+                continue
+
+            if acquired:
+                RATE_LIMIT_TOKENS.labels(
+                    self.end_point_tracker.seller_id, self.end_point_tracker.end_point_name
+                ).inc()
+            return acquired
+
+        return False
+
+    def remaining(self):
+        self.seed()
+        return max(cache.get(self.key, 0), 0)
+
+    def reset_at(self):
+        return cache.get(self.reset_key) or now()
+
+    def update(self, response):
+        headers = response.headers
+        if "x-ratelimit-reset" not in headers:
+            return
+
+        remaining = 0 if response.status_code == 429 else int(headers["x-ratelimit-remaining"])
+        # the latest the window can end, x-ratelimit-reset is rounded down to whole seconds.
+        limit_reset_at = now() + timedelta(seconds=max(int(headers["x-ratelimit-reset"]), 1) + 1)
+        window_reset_at = cache.get(self.reset_key)
+        if window_reset_at is None:
+            cache.set(self.key, remaining, timeout=seconds_until(limit_reset_at))
+        else:
+            # bol.com doesn't count the requests still in flight, their tokens are taken already
+            # so the bucket only goes down until the window ends.
+            limit_reset_at = min(limit_reset_at, window_reset_at)
+            remaining = self.lower(remaining, seconds_until(limit_reset_at))
+        cache.set(self.reset_key, limit_reset_at, timeout=seconds_until(limit_reset_at))
+
+        if response.status_code == 429 or cache.add(
+            self.flush_key, True, timeout=settings.RATE_LIMIT_FLUSH_INTERVAL
+        ):
+            self.flush(max(remaining, 0), limit_reset_at)
+
+    def lower(self, remaining, timeout):
+        """Lowers the bucket to remaining & returns what is left in it, it is never raised."""
+        current = cache.get(self.key)
+        if current is None:
+            cache.add(self.key, remaining, timeout=timeout)
+            return remaining
+
+        cache.touch(self.key, timeout)
+        if current <= remaining:
+            return current
+        try:
+            # decr instead of set, tokens taken since the get stay taken.
+            return cache.decr(self.key, current - remaining)
+        except ValueError:
+            return remaining
+
+    def flush(self, remaining, limit_reset_at):
+        self.end_point_tracker.remaining_req_limit = remaining
+        self.end_point_tracker.limit_reset_at = limit_reset_at
+        SellerEndPointTracker.objects.filter(id=self.end_point_tracker.id).update(
+            remaining_req_limit=remaining, limit_reset_at=limit_reset_at
+        )
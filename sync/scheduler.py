@@ -0,0 +1,120 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from . import constants
+from .models import SellerEndPointTracker, ShipmentSyncTracker
+from .ratelimit import RateLimiter
+
+
+def sync_queue(initial_scan_completed):
+    """Sellers still on their initial scan use the onboarding lane, others follow CELERY_TASK_ROUTES."""
+    return None if initial_scan_completed else settings.SYNC_ONBOARDING_QUEUE
+
+
+def onboarding_seller_ids(seller_ids):
+    return set(
+        SellerEndPointTracker.objects.filter(
+            seller_id__in=seller_ids, end_point_name=constants.SHIPMENT_LIST_ENDPOINT_NAME
+        )
+        .exclude(initial_fbb_completed=True, initial_fbr_completed=True)
+        .values_list("seller_id", flat=True)
+    )
+
+
+def end_point_queue(end_point_tracker):
+    if end_point_tracker.end_point_name == constants.SHIPMENT_LIST_ENDPOINT_NAME:
+        return sync_queue(end_point_tracker.initial_scan_completed)
+    return sync_queue(end_point_tracker.seller_id not in onboarding_seller_ids([end_point_tracker.seller_id]))
+
+
+def dispatch_key(end_point_tracker):
+    return "sync:dispatch:%s:%s" % (end_point_tracker.seller_id, end_point_tracker.end_point_name)
+
+
+def schedule_dispatch(end_point_tracker, eta=None, args=()):
+    """
+    Queues the next run of a seller's end point at eta, right away by default, unless a run is
+    pending already. Returns whether a run was queued.
+    """
+    from .tasks import SyncShipmentDetailEndPoint, SyncShipmentListEndPoint
+
+    eta = max(eta or now(), now())
+    # a lost message only blocks the seller until the key expires, the beat sweep queues it again.
+    timeout = int((eta - now()).total_seconds()) + settings.SYNC_LEASE_SECONDS
+    if not cache.add(dispatch_key(end_point_tracker), True, timeout=timeout):
+        return False
+
+    if end_point_tracker.end_point_name == constants.SHIPMENT_LIST_ENDPOINT_NAME:
+        task = SyncShipmentListEndPoint
+    else:
+        task = SyncShipmentDetailEndPoint
+    task.apply_async(args=[end_point_tracker.id, *args], eta=eta, queue=end_point_queue(end_point_tracker))
+    return True
+
+
+def dispatch_started(end_point_tracker):
+    """Called by a queued run as it starts, so it can queue its successor."""
+    cache.delete(dispatch_key(end_point_tracker))
+
+
+def scan_lock_key(seller_id):
+    return "sync:scan:%s" % seller_id
+
+
+def lock_scan(seller_id, run_id):
+    """
+    Only one list scan of a seller runs at a time, they all advance the same checkpoints. The lock
+    expires SYNC_LEASE_SECONDS after the scan last extended it, in case its worker died.
+    """
+    return cache.add(scan_lock_key(seller_id), run_id, timeout=settings.SYNC_LEASE_SECONDS)
+
+
+def extend_scan_lock(seller_id):
+    cache.touch(scan_lock_key(seller_id), settings.SYNC_LEASE_SECONDS)
+
+
+def unlock_scan(seller_id, run_id):
+    if cache.get(scan_lock_key(seller_id)) == run_id:
+        cache.delete(scan_lock_key(seller_id))
+
+
+def schedule_next_detail_dispatch(end_point_tracker):
+    """Queues the seller's next detail run for when its budget allows, if shipments are waiting."""
+    if not ShipmentSyncTracker.objects.pending_ids(end_point_tracker.seller_id).exists():
+        return
+
+    limiter = RateLimiter(end_point_tracker)
+    schedule_dispatch(end_point_tracker, eta=None if limiter.remaining() else limiter.reset_at())
+
+
+def schedule_detail_fetches(end_point_tracker):
+    """
+    Spends the seller's detail budget on its pending shipments, every batch is leased to its task.
+    Each seller's detail runs are queued on their own, so no seller waits behind another's backlog.
+    Returns the number of dispatched batches.
+    """
+    from .tasks import SyncShipmentDetails
+
+    queue = end_point_queue(end_point_tracker)
+    budget = RateLimiter(end_point_tracker).remaining()
+    dispatched = 0
+    while budget > 0:
+        lease_owner = uuid.uuid4().hex
+        shipment_tracker_ids = ShipmentSyncTracker.objects.claim(
+            end_point_tracker.seller_id,
+            min(budget, settings.BOL_DETAIL_BATCH_SIZE),
+            lease_owner,
+            settings.SYNC_LEASE_SECONDS,
+        )
+        if not shipment_tracker_ids:
+            break
+
+        SyncShipmentDetails.apply_async(
+            args=[end_point_tracker.id, shipment_tracker_ids, lease_owner], queue=queue
+        )
+        budget -= len(shipment_tracker_ids)
+        dispatched += 1
+    return dispatched
@@ -1,148 +1,293 @@
 import base64
+import logging
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import timedelta
-from io import BytesIO
 
-import requests
+from django.conf import settings
+from django.db import DatabaseError, transaction
 from django.utils.timezone import now
-from djangorestframework_camel_case.parser import CamelCaseJSONParser
-from requests import HTTPError
+from requests import HTTPError, RequestException
 
-from boloo_shop import celery_app
+from boloo_shop import bol, celery_app
 from shipments.models import Shipment
-from shipments.serializers import ShipmentSerializer
+from shipments.tasks import refresh_rejected_token
 from shipments.utils import AccessToken
 
 from . import constants
-from .exceptons import SyncCompletedError
-from .models import SellerEndPointTracker, ShipmentSyncTracker
+from .decoders import decode_shipment
+from .exceptons import ShipmentDecodeError, SyncCompletedError
+from .models import ListScanCheckpoint, SellerEndPointTracker, ShipmentSyncTracker
+from .ratelimit import RateLimiter
+from .scheduler import (
+    dispatch_started,
+    extend_scan_lock,
+    lock_scan,
+    schedule_detail_fetches,
+    schedule_dispatch,
+    schedule_next_detail_dispatch,
+    unlock_scan,
+)
+from .writers import write_shipments
+
+logger = logging.getLogger(__name__)
 
 
 class SyncEndPoints(celery_app.Task):
+    """Safety net, runs queue their own successors. Queues a run for end points which have none pending."""
+
     def run(self):
         for seller_end_pont in SellerEndPointTracker.objects.eligible_end_points():
-            if seller_end_pont.end_point_name == constants.SHIPMENT_LIST_ENDPOINT_NAME:
-                SyncShipmentListEndPoint.delay(seller_end_pont.id, 1, constants.FULFILMENT_METHODS[0])
-            else:
-                SyncShipmentDetailEndPoint.delay(seller_end_pont.id,)
+            schedule_dispatch(seller_end_pont)
 
 
 class SyncShipmentListEndPoint(celery_app.Task):
-    def run(self, end_point_tracker_id, page, start_method):
-        self.page = page
+    def run(self, end_point_tracker_id, page=None, start_method=constants.FBR):
+        # page is only kept for messages queued before checkpoints, scans resume from their checkpoint.
         self.end_point_tracker = SellerEndPointTracker.objects.get(id=end_point_tracker_id)
-        self.seller = self.end_point_tracker.seller
+        self.seller_id = self.end_point_tracker.seller_id
+        self.limiter = RateLimiter(self.end_point_tracker)
+        dispatch_started(self.end_point_tracker)
 
+        run_id = self.request.id or uuid.uuid4().hex
+        if not lock_scan(self.seller_id, run_id):
+            # the running scan queues the next one when it ends.
+            return
+        try:
+            eta, args = self.scan(start_method)
+        finally:
+            unlock_scan(self.seller_id, run_id)
+        # queued once the lock is released, so the next run can't find it taken.
+        schedule_dispatch(self.end_point_tracker, eta=eta, args=args)
+
+    def scan(self, start_method):
+        """Scans the shipment list from the checkpoints on. Returns the eta & args of the next run."""
         for method in constants.FULFILMENT_METHODS[constants.FULFILMENT_METHODS.index(start_method) :]:
+            self.checkpoint, _ = ListScanCheckpoint.objects.get_or_create(
+                seller_id=self.seller_id, fulfilment_method=method
+            )
+            self.page = self.checkpoint.page
+
             while True:
+                extend_scan_lock(self.seller_id)
+                if not self.limiter.acquire():
+                    return self.resume_later(method, eta=self.limiter.reset_at())
+
                 response = self.fetch(method)
 
                 if response.status_code == 200:
                     try:
                         self.save_success(response, method)
                     except SyncCompletedError:
+                        self.checkpoint.complete()
                         break
                     self.page = self.page + 1
+                    self.checkpoint.advance(self.page)
                     continue
 
                 if response.status_code == 429:
-                    SyncShipmentListEndPoint.apply_async(
-                        args=[end_point_tracker_id, self.page, method],
-                        eta=now() + timedelta(seconds=int(response.headers["retry-after"])),
+                    self.limiter.update(response)
+                    return self.resume_later(
+                        method, eta=now() + timedelta(seconds=int(response.headers["retry-after"]))
                     )
-                    return
+
+                if response.status_code == 401:
+                    refresh_rejected_token(self.seller_id)
+                    retry_at = now() + timedelta(seconds=constants.TOKEN_REFRESH_RETRY_DELAY)
+                    return self.resume_later(method, eta=retry_at)
 
                 response.raise_for_status()
-            self.page = 1
+
+        # look for new shipments again once the whole list is scanned.
+        return now() + timedelta(seconds=settings.SYNC_POLL_INTERVAL), ()
+
+    def resume_later(self, method, eta):
+        return eta, [self.page, method]
+
+    def fetch_details(self):
+        detail_end_point_tracker = SellerEndPointTracker.objects.filter(
+            seller_id=self.seller_id, end_point_name=constants.SHIPMENT_DETAIL_ENDPOINT_NAME
+        ).first()
+        if detail_end_point_tracker is not None:
+            schedule_dispatch(detail_end_point_tracker)
 
     def fetch(self, method):
-        return requests.get(
+        return bol.get(
             url=constants.SHIPMENTS_URL,
+            token=AccessToken.get(self.seller_id),
+            end_point_name=constants.SHIPMENT_LIST_ENDPOINT_NAME,
             params={"page": self.page, "fulfilment-method": method},
-            headers={
-                "Accept": "application/vnd.retailer.v3+json",
-                "Authorization": "Bearer %s" % self.seller.access_token,
-            },
+            headers={"Accept": "application/vnd.retailer.v3+json"},
         )
 
     def save_success(self, response, method):
-        data = response.json()
-        headers = response.headers
-        shipments = data.get("shipments", [])
-        self.end_point_tracker.remaining_req_limit = int(headers["x-ratelimit-remaining"])
-        self.end_point_tracker.limit_reset_at = now() + timedelta(seconds=int(headers["x-ratelimit-reset"]))
+        shipments = response.json().get("shipments", [])
+        self.limiter.update(response)
 
         # last page reached
         if not shipments:
-            setattr(
-                self.end_point_tracker, SellerEndPointTracker.fulfilment_method_mapper[method], True,
-            )
-            self.end_point_tracker.save()
+            field_name = SellerEndPointTracker.fulfilment_method_mapper[method]
+            setattr(self.end_point_tracker, field_name, True)
+            self.end_point_tracker.save(update_fields=[field_name])
             raise SyncCompletedError("Last page reached")
 
-        self.end_point_tracker.save()
         self.save_shipments(shipments, method)
 
     def save_shipments(self, shipments, method):
-        for shipment in shipments:
-            _, created = ShipmentSyncTracker.objects.get_or_create(
-                shipment_id=shipment["shipmentId"], seller=self.seller
-            )
+        shipment_ids = [str(shipment["shipmentId"]) for shipment in shipments]
+        initial_scan_completed = getattr(
+            self.end_point_tracker, SellerEndPointTracker.fulfilment_method_mapper[method]
+        )
+
+        # shipments are listed newest first, so the first one of a scan becomes the next high water mark.
+        if self.page == 1:
+            self.checkpoint.scan_high_water_shipment_id = shipment_ids[0]
+
+        high_water_shipment_id = self.checkpoint.high_water_shipment_id
+        if initial_scan_completed and high_water_shipment_id in shipment_ids:
+            new_shipment_ids = shipment_ids[: shipment_ids.index(high_water_shipment_id)]
+            if new_shipment_ids:
+                ShipmentSyncTracker.objects.track(self.seller_id, new_shipment_ids)
+                self.fetch_details()
+            raise SyncCompletedError("Reached the high water mark")
+
+        existing_ids = ShipmentSyncTracker.objects.track(self.seller_id, shipment_ids)
+        if len(existing_ids) < len(shipment_ids):
+            self.fetch_details()
+
+        # if all pages already scanned and shipment exists then it means no new shipment.
+        if existing_ids and initial_scan_completed:
+            raise SyncCompletedError("Reached to already synced shipment")
 
-            # if all pages already scanned and shipment exists then it means no new shipment.
-            if not created and getattr(
-                self.end_point_tracker, SellerEndPointTracker.fulfilment_method_mapper[method]
-            ):
-                raise SyncCompletedError("Reached to already synced shipment")
+
+def decode_response(seller_id, response):
+    """Returns the unsaved shipment of a detail response, None when bol.com sent something we can't decode."""
+    try:
+        return decode_shipment(response.content, seller_id)
+    except ShipmentDecodeError as e:
+        logger.warning("Invalid shipment detail of seller %s: %s", seller_id, e)
+
+
+def fetch_shipment(token, shipment_id):
+    return bol.get(
+        url=constants.SHIPMENT_URL.format(shipment_id),
+        token=token,
+        end_point_name=constants.SHIPMENT_DETAIL_ENDPOINT_NAME,
+        headers={"Accept": "application/vnd.retailer.v3+json"},
+    )
 
 
 class SyncShipmentDetailEndPoint(celery_app.Task):
     def run(self, end_point_tracker_id):
         end_point_tracker = SellerEndPointTracker.objects.get(id=end_point_tracker_id)
-        slice_limit = end_point_tracker.remaining_req_limit or 14
+        dispatch_started(end_point_tracker)
+        # dispatched batches queue the next run once they are done.
+        if not schedule_detail_fetches(end_point_tracker):
+            schedule_next_detail_dispatch(end_point_tracker)
+
+
+class SyncShipmentDetails(celery_app.Task):
+    """Fetches a batch of shipment details concurrently and saves them in a single transaction."""
+
+    def run(self, end_point_tracker_id, shipment_tracker_ids, lease_owner=None):
+        end_point_tracker = SellerEndPointTracker.objects.get(id=end_point_tracker_id)
+        shipment_trackers = list(ShipmentSyncTracker.objects.leased(shipment_tracker_ids, lease_owner))
+        responses = self.fetch_all(shipment_trackers, RateLimiter(end_point_tracker))
+
+        token_rejected = any(response.status_code == 401 for response in responses.values())
+        if token_rejected:
+            refresh_rejected_token(end_point_tracker.seller_id)
+
+        parsed_shipments, failed_ids = {}, []
+        for shipment_tracker in shipment_trackers:
+            response = responses.get(shipment_tracker.id)
+            if response is None or response.status_code not in (200, 404):
+                continue
+
+            parsed_shipment = None
+            if response.status_code == 200:
+                parsed_shipment = decode_response(shipment_tracker.seller_id, response)
+            if parsed_shipment is None:
+                failed_ids.append(shipment_tracker.id)
+            else:
+                parsed_shipments[shipment_tracker.id] = parsed_shipment
 
-        for shipment_tracker_id in ShipmentSyncTracker.objects.filter(
-            state=ShipmentSyncTracker.NOT_STARTED
-        ).values_list("id", flat=True)[:slice_limit]:
-            SyncShipmentDetail.apply_async(args=[end_point_tracker.id, shipment_tracker_id])
+        unfinished_ids = [
+            tracker.id
+            for tracker in shipment_trackers
+            if tracker.id not in parsed_shipments and tracker.id not in failed_ids
+        ]
+        try:
+            with transaction.atomic():
+                write_shipments(parsed_shipments.values())
+                ShipmentSyncTracker.objects.finish(list(parsed_shipments), lease_owner)
+                ShipmentSyncTracker.objects.fail(failed_ids, lease_owner)
+                ShipmentSyncTracker.objects.release(unfinished_ids, lease_owner)
+        except DatabaseError:
+            # nothing of the batch was written, hand it back instead of waiting for the lease to expire.
+            ShipmentSyncTracker.objects.release([tracker.id for tracker in shipment_trackers], lease_owner)
+            raise
+
+        if token_rejected:
+            retry_at = now() + timedelta(seconds=constants.TOKEN_REFRESH_RETRY_DELAY)
+            schedule_dispatch(end_point_tracker, eta=retry_at)
+        else:
+            schedule_next_detail_dispatch(end_point_tracker)
+
+    def fetch_all(self, shipment_trackers, limiter):
+        pending = iter(shipment_trackers)
+        in_flight = {}
+        responses = {}
+
+        with ThreadPoolExecutor(max_workers=settings.BOL_DETAIL_CONCURRENCY) as executor:
+            while True:
+                # a token is taken for every request & responses never hand back the tokens of requests
+                # still in flight, so we stop as soon as the bucket is empty.
+                while len(in_flight) < settings.BOL_DETAIL_CONCURRENCY:
+                    shipment_tracker = next(pending, None)
+                    if shipment_tracker is None or not limiter.acquire():
+                        pending = iter(())
+                        break
+                    future = executor.submit(
+                        fetch_shipment,
+                        AccessToken.get(shipment_tracker.seller_id),
+                        shipment_tracker.shipment_id,
+                    )
+                    in_flight[future] = shipment_tracker
+
+                if not in_flight:
+                    return responses
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shipment_tracker = in_flight.pop(future)
+                    try:
+                        response = future.result()
+                    except RequestException:
+                        continue
+
+                    responses[shipment_tracker.id] = response
+                    limiter.update(response)
 
 
 class SyncShipmentDetail(celery_app.Task):
+    """Only drains messages queued before detail batches, their shipment is synced as a batch of one."""
+
     def run(self, end_point_tracker_id, shipment_tracker_id):
-        shipment_tracker = ShipmentSyncTracker.objects.get(id=shipment_tracker_id)
-        end_point_tracker = SellerEndPointTracker.objects.get(id=end_point_tracker_id)
-        shipment_tracker.state = ShipmentSyncTracker.STARTED
-        shipment_tracker.save()
-        response = self.fetch(shipment_tracker.seller.access_token, shipment_tracker.shipment_id)
-
-        if response.status_code == 200:
-            end_point_tracker.remaining_req_limit = int(response.headers["x-ratelimit-remaining"])
-            end_point_tracker.limit_reset_at = now() + timedelta(
-                seconds=int(response.headers["x-ratelimit-reset"])
-            )
-            end_point_tracker.save()
-            stream = BytesIO(bytes(response.text, 'utf-8'))
-            serializer = ShipmentSerializer(data=CamelCaseJSONParser().parse(stream=stream), context={"seller": shipment_tracker.seller})
-            serializer.is_valid()
-            serializer.save()
-            shipment_tracker.state = ShipmentSyncTracker.FINISHED
-            shipment_tracker.save()
-
-        elif response.status_code == 429:
-            end_point_tracker.remaining_req_limit = 0
-            end_point_tracker.limit_reset_at = now() + timedelta(
-                seconds=int(response.headers["x-ratelimit-reset"])
-            )
-            end_point_tracker.save()
+        lease_owner = self.request.id or uuid.uuid4().hex
+        shipment_trackers = ShipmentSyncTracker.objects.filter(id=shipment_tracker_id)
+        if ShipmentSyncTracker.objects.lease(shipment_trackers, lease_owner, settings.SYNC_LEASE_SECONDS):
+            SyncShipmentDetails.run(end_point_tracker_id, [shipment_tracker_id], lease_owner)
 
-    def fetch(self, token, shipment_id):
-        response = requests.get(
-            url=constants.SHIPMENT_URL.format(shipment_id),
-            headers={"Accept": "application/vnd.retailer.v3+json", "Authorization": "Bearer %s" % token,},
-        )
-        return response
+
+class ReapShipmentLeases(celery_app.Task):
+    def run(self):
+        ShipmentSyncTracker.objects.reap()
 
 
 SyncEndPoints = celery_app.register_task(SyncEndPoints())
 SyncShipmentListEndPoint = celery_app.register_task(SyncShipmentListEndPoint())
 SyncShipmentDetailEndPoint = celery_app.register_task(SyncShipmentDetailEndPoint())
 SyncShipmentDetail = celery_app.register_task(SyncShipmentDetail())
+SyncShipmentDetails = celery_app.register_task(SyncShipmentDetails())
+ReapShipmentLeases = celery_app.register_task(ReapShipmentLeases())
@@ -0,0 +1,478 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+
+from shipments.archive import archive_shipments
+from shipments.models import Shipment, ShipmentItem, Transport, UserData
+from shipments.tests import create_seller
+
+from . import constants
+from .decoders import Field, decode_shipment
+from .models import ListScanCheckpoint, SellerEndPointTracker, SellerSyncStatus, ShipmentSyncTracker
+from .ratelimit import RateLimiter
+from .scheduler import dispatch_key, lock_scan, scan_lock_key
+from .tasks import SyncShipmentDetail, SyncShipmentDetails, SyncShipmentListEndPoint
+from .writers import write_shipments
+
+
+def create_end_point_tracker(seller, end_point_name=constants.SHIPMENT_LIST_ENDPOINT_NAME):
+    return SellerEndPointTracker.objects.create(
+        seller=seller,
+        end_point_name=end_point_name,
+        remaining_req_limit=constants.RATE_LIMITS[end_point_name],
+        limit_reset_at=now(),
+    )
+
+
+def shipment_detail(shipment_id, **changes):
+    """A bol.com shipment detail response body."""
+    detail = {
+        "shipmentId": shipment_id,
+        "pickUpPoint": False,
+        "shipmentDate": "2020-05-04T10:00:00+02:00",
+        "shipmentReference": "",
+        "shipmentItems": [
+            {
+                "orderItemId": "item-%s" % shipment_id,
+                "orderId": "order-%s" % shipment_id,
+                "orderDate": "2020-05-03T10:00:00+02:00",
+                "latestDeliveryDate": "2020-05-05T10:00:00+02:00",
+                "ean": "8712345678901",
+                "title": "title",
+                "quantity": 1,
+                "offerPrice": "9.99",
+                "offerCondition": "NEW",
+                "fulfilmentMethod": constants.FBR,
+            }
+        ],
+        "transport": {
+            "transportId": shipment_id,
+            "transporterCode": "TNT",
+            "trackAndTrace": "3S%s" % shipment_id,
+        },
+        "customerDetails": {"firstName": "Jan", "city": "Utrecht", "email": "jan@example.com"},
+    }
+    detail.update(changes)
+    return detail
+
+
+def detail_response(detail, status_code=200):
+    return mock.Mock(status_code=status_code, headers={}, content=json.dumps(detail).encode())
+
+
+class ListScanLockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = create_seller()
+        self.end_point_tracker = create_end_point_tracker(self.seller)
+
+    @mock.patch("sync.tasks.schedule_dispatch")
+    @mock.patch("sync.tasks.bol.get")
+    def test_run_stops_while_another_scan_runs(self, get, schedule_dispatch):
+        cache.add(dispatch_key(self.end_point_tracker), True)
+        self.assertTrue(lock_scan(self.seller.id, "running-scan"))
+
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+
+        get.assert_not_called()
+        schedule_dispatch.assert_not_called()
+        self.assertFalse(ListScanCheckpoint.objects.exists())
+        # the running scan may queue its successor.
+        self.assertIsNone(cache.get(dispatch_key(self.end_point_tracker)))
+        self.assertEqual(cache.get(scan_lock_key(self.seller.id)), "running-scan")
+
+    @mock.patch("sync.tasks.schedule_dispatch")
+    @mock.patch("sync.tasks.bol.get")
+    def test_lock_is_released_before_the_next_run_is_queued(self, get, schedule_dispatch):
+        get.return_value = mock.Mock(status_code=200, headers={}, json=lambda: {"shipments": []})
+        schedule_dispatch.side_effect = lambda *args, **kwargs: self.assertIsNone(
+            cache.get(scan_lock_key(self.seller.id))
+        )
+
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+
+        self.assertEqual(get.call_count, len(constants.FULFILMENT_METHODS))
+        schedule_dispatch.assert_called_once()
+        self.assertIsNone(cache.get(scan_lock_key(self.seller.id)))
+
+
+class TrackTests(TestCase):
+    def setUp(self):
+        self.seller = create_seller()
+
+    def test_counts_only_inserted_trackers(self):
+        ShipmentSyncTracker.objects.track(self.seller.id, ["1"])
+        # shipment ids are unique across sellers, the conflicting insert is ignored.
+        ShipmentSyncTracker.objects.create(seller=create_seller(), shipment_id="3")
+
+        existing_ids = ShipmentSyncTracker.objects.track(self.seller.id, ["1", "2", "3"])
+
+        self.assertEqual(existing_ids, {"1"})
+        status = SellerSyncStatus.objects.get(seller=self.seller)
+        self.assertEqual((status.discovered, status.pending), (2, 2))
+        self.assertEqual(self.seller.shipments_to_sync.count(), 2)
+
+    def test_status_row_is_locked_before_the_trackers(self):
+        select_for_update = QuerySet.select_for_update
+        locked = []
+
+        def record_lock(queryset, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, **kwargs)
+
+        def assert_status_locked_first(lock_trackers):
+            locked.clear()
+            lock_trackers()
+            self.assertEqual(locked[:2], [SellerSyncStatus, ShipmentSyncTracker])
+
+        manager = ShipmentSyncTracker.objects
+        with mock.patch.object(QuerySet, "select_for_update", autospec=True, side_effect=record_lock):
+            manager.track(self.seller.id, ["1", "2"])
+            # the expired lease is reaped right away.
+            assert_status_locked_first(lambda: manager.claim(self.seller.id, 1, "expired-owner", -1))
+            assert_status_locked_first(lambda: manager.reap())
+            assert_status_locked_first(lambda: manager.claim(self.seller.id, 2, "owner", 60))
+            assert_status_locked_first(lambda: manager.finish(manager.values_list("id", flat=True), "owner"))
+        self.assertEqual(manager.filter(state=ShipmentSyncTracker.FINISHED).count(), 2)
+
+
+class DecoderFieldTests(TestCase):
+    def convert(self, model, field_name, value):
+        return Field(model._meta.get_field(field_name)).convert(value)
+
+    def test_integers(self):
+        for value, expected in [(3, 3), (3.0, 3), ("3", 3), ("3.00", 3)]:
+            self.assertEqual(self.convert(ShipmentItem, "quantity", value), expected)
+        for value in [1.9, "1.9", True, "", [1], {"value": 1}]:
+            with self.assertRaises(ValueError):
+                self.convert(ShipmentItem, "quantity", value)
+
+    def test_strings(self):
+        self.assertEqual(self.convert(ShipmentItem, "ean", " 8712345678901 "), "8712345678901")
+        self.assertEqual(self.convert(ShipmentItem, "ean", 8712345678901), "8712345678901")
+        self.assertEqual(self.convert(ShipmentItem, "offer_reference", " "), "")
+        for value in [True, ["1"], {"ean": "1"}, " "]:
+            with self.assertRaises(ValueError):
+                self.convert(ShipmentItem, "ean", value)
+
+    def test_decimals(self):
+        self.assertEqual(str(self.convert(ShipmentItem, "offer_price", "9.5")), "9.50")
+        for value in ["NaN", "Infinity", True, [1]]:
+            with self.assertRaises(ValueError):
+                self.convert(ShipmentItem, "offer_price", value)
+
+    def test_emails(self):
+        self.assertEqual(self.convert(UserData, "email", "buyer@example.com"), "buyer@example.com")
+        self.assertEqual(self.convert(UserData, "email", ""), "")
+        with self.assertRaises(ValueError):
+            self.convert(UserData, "email", "not an email")
+
+
+def rate_limit_response(remaining, reset, status_code=200):
+    return mock.Mock(
+        status_code=status_code,
+        headers={"x-ratelimit-remaining": str(remaining), "x-ratelimit-reset": str(reset)},
+    )
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.end_point_tracker = create_end_point_tracker(
+            create_seller(), end_point_name=constants.SHIPMENT_DETAIL_ENDPOINT_NAME
+        )
+        self.limiter = RateLimiter(self.end_point_tracker)
+
+    def test_updates_never_raise_the_bucket_within_a_window(self):
+        for _ in range(5):
+            self.assertTrue(self.limiter.acquire())
+        self.limiter.update(rate_limit_response(constants.SHIPMENT_DETAIL_RATE_LIMIT - 1, 50))
+        limit = constants.SHIPMENT_DETAIL_RATE_LIMIT
+
+        # responses of the first requests arrive while the others are still in flight.
+        for remaining in (limit - 2, limit - 3, limit - 1):
+            self.limiter.update(rate_limit_response(remaining, 50))
+            self.assertEqual(self.limiter.remaining(), limit - 5)
+
+        self.limiter.update(rate_limit_response(2, 49))
+        self.assertEqual(self.limiter.remaining(), 2)
+        self.limiter.update(rate_limit_response(0, 49, status_code=429))
+        self.assertEqual(self.limiter.remaining(), 0)
+        self.assertFalse(self.limiter.acquire())
+
+    def test_bucket_is_refilled_once_the_window_ends(self):
+        for _ in range(5):
+            self.limiter.acquire()
+        self.limiter.update(rate_limit_response(0, 5, status_code=429))
+        self.assertLessEqual(self.limiter.reset_at(), now() + timedelta(seconds=6))
+
+        # the keys expire with the window.
+        cache.delete_many([self.limiter.key, self.limiter.reset_key])
+        self.limiter.update(rate_limit_response(constants.SHIPMENT_DETAIL_RATE_LIMIT - 1, 60))
+        self.assertEqual(self.limiter.remaining(), constants.SHIPMENT_DETAIL_RATE_LIMIT - 1)
+
+
+class SyncShipmentDetailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = create_seller()
+        self.end_point_tracker = create_end_point_tracker(
+            self.seller, end_point_name=constants.SHIPMENT_DETAIL_ENDPOINT_NAME
+        )
+
+    @mock.patch("sync.tasks.AccessToken.get", return_value="token")
+    @mock.patch("sync.tasks.bol.get")
+    def test_queued_single_detail_is_synced_as_a_batch(self, get, get_token):
+        get.return_value = detail_response(shipment_detail(1))
+        ShipmentSyncTracker.objects.track(self.seller.id, [1])
+        shipment_tracker = ShipmentSyncTracker.objects.get()
+
+        SyncShipmentDetail.run(self.end_point_tracker.id, shipment_tracker.id)
+
+        shipment_tracker.refresh_from_db()
+        self.assertEqual(shipment_tracker.state, ShipmentSyncTracker.FINISHED)
+        self.assertTrue(self.seller.shipments.filter(shipment_id=1).exists())
+
+        # a tracker which is leased or synced already isn't fetched again.
+        SyncShipmentDetail.run(self.end_point_tracker.id, shipment_tracker.id)
+        get.assert_called_once()
+
+
+class WriteShipmentsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = create_seller()
+
+    def write(self, *details):
+        return write_shipments(
+            [decode_shipment(json.dumps(detail).encode(), self.seller.id) for detail in details]
+        )
+
+    def test_new_shipments_are_inserted(self):
+        billing = {"firstName": "Piet", "city": "Amsterdam"}
+        self.write(shipment_detail(1), shipment_detail(2, billingDetails=billing))
+
+        first, second = Shipment.objects.with_details().order_by("shipment_id")
+        self.assertIsNone(first.billing)
+        self.assertEqual(second.billing.first_name, "Piet")
+        self.assertEqual(first.customer, second.customer)
+        self.assertEqual(first.transport.track_and_trace, "3S1")
+        self.assertEqual([item.order_item_id for item in second.items.all()], ["item-2"])
+
+    def test_shipments_are_updated_in_place(self):
+        self.write(shipment_detail(1))
+        shipment = Shipment.objects.get()
+
+        item = dict(shipment_detail(1)["shipmentItems"][0], orderItemId="item-1b", quantity=2)
+        self.write(
+            shipment_detail(
+                1,
+                shipmentReference="ref",
+                transport={"transportId": 1, "transporterCode": "DHL", "trackAndTrace": "JVGL1"},
+                shipmentItems=[item],
+                billingDetails={"firstName": "Piet"},
+            )
+        )
+
+        updated = Shipment.objects.with_details().get()
+        self.assertEqual((updated.pk, updated.transport_id), (shipment.pk, shipment.transport_id))
+        self.assertEqual(updated.shipment_reference, "ref")
+        transport = updated.transport
+        self.assertEqual((transport.transporter_code, transport.track_and_trace), ("DHL", "JVGL1"))
+        self.assertEqual([(i.order_item_id, i.quantity) for i in updated.items.all()], [("item-1b", 2)])
+        self.assertEqual(updated.billing.first_name, "Piet")
+        self.assertEqual((Transport.objects.count(), ShipmentItem.objects.count()), (1, 1))
+
+    def test_archived_shipments_are_skipped(self):
+        self.write(shipment_detail(1), shipment_detail(2, shipmentDate="2021-05-04T10:00:00+02:00"))
+        archive_shipments(parse_datetime("2021-01-01T00:00:00+01:00"), batch_size=10)
+
+        saved = self.write(shipment_detail(1, shipmentReference="ref"), shipment_detail(3))
+
+        self.assertEqual([shipment.shipment_id for shipment in saved], [3])
+        self.assertEqual(self.seller.archived_shipments.get().shipment_reference, "")
+        self.assertEqual(sorted(self.seller.shipments.values_list("shipment_id", flat=True)), [2, 3])
+
+    @mock.patch("sync.tasks.AccessToken.get", return_value="token")
+    @mock.patch("sync.tasks.bol.get")
+    def test_database_error_rolls_back_the_batch(self, get, get_token):
+        get.side_effect = lambda url, **kwargs: detail_response(shipment_detail(int(url.rsplit("/", 1)[-1])))
+        end_point_tracker = create_end_point_tracker(
+            self.seller, end_point_name=constants.SHIPMENT_DETAIL_ENDPOINT_NAME
+        )
+        ShipmentSyncTracker.objects.track(self.seller.id, [1, 2])
+        tracker_ids = ShipmentSyncTracker.objects.claim(self.seller.id, 2, "owner", 60)
+
+        with mock.patch.object(Shipment.objects, "upsert", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                SyncShipmentDetails.run(end_point_tracker.id, tracker_ids, "owner")
+
+        self.assertFalse(Transport.objects.exists())
+        self.assertFalse(UserData.objects.exists())
+        self.assertEqual(
+            set(ShipmentSyncTracker.objects.values_list("state", "lease_owner")),
+            {(ShipmentSyncTracker.NOT_STARTED, "")},
+        )
+        status = SellerSyncStatus.objects.get(seller=self.seller)
+        self.assertEqual((status.pending, status.in_flight, status.finished), (2, 0, 0))
+
+
+class LeaseTests(TestCase):
+    def setUp(self):
+        self.seller = create_seller()
+        ShipmentSyncTracker.objects.track(self.seller.id, ["1", "2", "3"])
+
+    def states(self):
+        return sorted(ShipmentSyncTracker.objects.values_list("state", flat=True))
+
+    def test_claimed_trackers_are_not_handed_out_twice(self):
+        first = ShipmentSyncTracker.objects.claim(self.seller.id, 2, "first", 60)
+        second = ShipmentSyncTracker.objects.claim(self.seller.id, 2, "second", 60)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(ShipmentSyncTracker.objects.claim(self.seller.id, 2, "third", 60), [])
+        # leasing a tracker which is leased already does nothing.
+        self.assertEqual(ShipmentSyncTracker.objects.lease(ShipmentSyncTracker.objects.all(), "third", 60), 0)
+        self.assertEqual(
+            set(ShipmentSyncTracker.objects.values_list("lease_owner", flat=True)), {"first", "second"}
+        )
+
+    def test_expired_leases_are_reaped_back_to_pending(self):
+        expired_ids = ShipmentSyncTracker.objects.claim(self.seller.id, 1, "expired", -1)
+        ShipmentSyncTracker.objects.claim(self.seller.id, 1, "running", 60)
+
+        self.assertEqual(ShipmentSyncTracker.objects.reap(), 1)
+
+        reaped = ShipmentSyncTracker.objects.get(id=expired_ids[0])
+        self.assertEqual(reaped.state, ShipmentSyncTracker.NOT_STARTED)
+        self.assertEqual((reaped.lease_owner, reaped.lease_expires_at), ("", None))
+        self.assertEqual(
+            self.states(),
+            [ShipmentSyncTracker.NOT_STARTED, ShipmentSyncTracker.NOT_STARTED, ShipmentSyncTracker.STARTED],
+        )
+        status = SellerSyncStatus.objects.get(seller=self.seller)
+        self.assertEqual((status.pending, status.in_flight), (2, 1))
+
+    def test_stale_owner_finishing_after_a_reap_is_a_no_op(self):
+        tracker_ids = ShipmentSyncTracker.objects.claim(self.seller.id, 1, "stale", -1)
+        ShipmentSyncTracker.objects.reap()
+        self.assertEqual(ShipmentSyncTracker.objects.claim(self.seller.id, 3, "new", 60)[0], tracker_ids[0])
+
+        self.assertEqual(ShipmentSyncTracker.objects.finish(tracker_ids, "stale"), 0)
+        self.assertEqual(ShipmentSyncTracker.objects.fail(tracker_ids, "stale"), 0)
+        self.assertEqual(ShipmentSyncTracker.objects.release(tracker_ids, "stale"), 0)
+
+        tracker = ShipmentSyncTracker.objects.get(id=tracker_ids[0])
+        self.assertEqual((tracker.state, tracker.lease_owner), (ShipmentSyncTracker.STARTED, "new"))
+        status = SellerSyncStatus.objects.get(seller=self.seller)
+        self.assertEqual((status.pending, status.in_flight, status.finished), (0, 3, 0))
+
+
+class ListScanCheckpointTests(TestCase):
+    page_size = 3
+
+    def setUp(self):
+        cache.clear()
+        self.seller = create_seller()
+        self.end_point_tracker = create_end_point_tracker(self.seller)
+        # shipment ids bol.com lists per fulfilment method, newest first.
+        self.listed = {constants.FBR: [10, 9, 8, 7, 6], constants.FBB: []}
+        self.throttled_pages = set()
+        patchers = [
+            mock.patch("sync.tasks.bol.get", side_effect=self.list_page),
+            mock.patch("sync.tasks.AccessToken.get", return_value="token"),
+            mock.patch("sync.tasks.schedule_dispatch"),
+            # the list budget is tested on its own.
+            mock.patch("sync.tasks.RateLimiter.acquire", return_value=True),
+        ]
+        self.get = patchers[0].start()
+        for patcher in patchers[1:]:
+            patcher.start()
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def list_page(self, url, params, **kwargs):
+        page, method = params["page"], params["fulfilment-method"]
+        if (page, method) in self.throttled_pages:
+            self.throttled_pages.discard((page, method))
+            return mock.Mock(status_code=429, headers={"retry-after": "5"})
+
+        start = (page - 1) * self.page_size
+        shipment_ids = self.listed[method][start : start + self.page_size]
+        shipments = [{"shipmentId": shipment_id} for shipment_id in shipment_ids]
+        return mock.Mock(status_code=200, headers={}, json=lambda: {"shipments": shipments})
+
+    def scanned_pages(self, method=constants.FBR):
+        return [
+            call.kwargs["params"]["page"]
+            for call in self.get.call_args_list
+            if call.kwargs["params"]["fulfilment-method"] == method
+        ]
+
+    def checkpoint(self, method=constants.FBR):
+        return ListScanCheckpoint.objects.get(seller=self.seller, fulfilment_method=method)
+
+    def tracked_ids(self):
+        return set(ShipmentSyncTracker.objects.values_list("shipment_id", flat=True))
+
+    def test_interrupted_scan_resumes_from_its_checkpoint(self):
+        self.throttled_pages.add((2, constants.FBR))
+
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+
+        checkpoint = self.checkpoint()
+        self.assertEqual(checkpoint.page, 2)
+        # the newest shipment only becomes the high water mark once the scan completes.
+        self.assertEqual(checkpoint.high_water_shipment_id, "")
+        self.assertEqual(checkpoint.scan_high_water_shipment_id, "10")
+        self.assertEqual(self.tracked_ids(), {"10", "9", "8"})
+
+        self.get.reset_mock()
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+
+        self.assertEqual(self.scanned_pages(), [2, 3])
+        checkpoint = self.checkpoint()
+        self.assertEqual(checkpoint.page, 1)
+        self.assertEqual(checkpoint.high_water_shipment_id, "10")
+        self.assertEqual(checkpoint.scan_high_water_shipment_id, "")
+        self.assertEqual(self.tracked_ids(), {"10", "9", "8", "7", "6"})
+
+    def test_complete_scan_stops_at_the_high_water_mark(self):
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+        self.assertEqual(self.checkpoint().high_water_shipment_id, "10")
+
+        # the older trackers are gone, only the shipments above the high water mark are new.
+        ShipmentSyncTracker.objects.all().delete()
+        self.listed[constants.FBR][:0] = [12, 11]
+        self.get.reset_mock()
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+
+        self.assertEqual(self.scanned_pages(), [1])
+        self.assertEqual(self.tracked_ids(), {"12", "11"})
+        self.assertEqual(self.checkpoint().high_water_shipment_id, "12")
+
+    def test_high_water_mark_only_moves_when_the_scan_completes(self):
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+        self.listed[constants.FBR][:0] = [16, 15, 14, 13, 12, 11]
+        self.throttled_pages.add((2, constants.FBR))
+
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+
+        checkpoint = self.checkpoint()
+        self.assertEqual((checkpoint.page, checkpoint.high_water_shipment_id), (2, "10"))
+        self.assertEqual(checkpoint.scan_high_water_shipment_id, "16")
+
+        SyncShipmentListEndPoint.run(self.end_point_tracker.id)
+
+        checkpoint = self.checkpoint()
+        self.assertEqual((checkpoint.page, checkpoint.high_water_shipment_id), (1, "16"))
+        self.assertEqual(self.tracked_ids(), {str(shipment_id) for shipment_id in range(6, 17)})
@@ -0,0 +1,130 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from shipments.cache import bump_shipments_version
+from shipments.models import ArchivedShipment, Shipment, ShipmentItem, Transport, UserData
+
+TRANSPORT_FIELDS = [field.name for field in Transport._meta.concrete_fields if not field.primary_key]
+
+
+def user_data_values(user_data):
+    return {field_name: getattr(user_data, field_name) for field_name in UserData.HASH_FIELDS}
+
+
+def read_back_transports(transports):
+    """
+    MySQL doesn't return the ids of bulk inserted rows. The new transports are the newest ones with
+    their transport id which aren't linked to a shipment yet, rows of other writers are invisible
+    until they commit & are linked by then.
+    """
+    ids = defaultdict(list)
+    rows = (
+        Transport.objects.filter(
+            transport_id__in={transport.transport_id for transport in transports},
+            transported_shipments__isnull=True,
+        )
+        .order_by("-id")
+        .values_list("id", "transport_id")
+    )
+    for transport_pk, transport_id in rows:
+        ids[transport_id].append(transport_pk)
+    for transport in reversed(transports):
+        transport.pk = ids[transport.transport_id].pop(0)
+
+
+def seller_shipment_ids(shipments):
+    shipment_ids = defaultdict(list)
+    for shipment in shipments:
+        shipment_ids[shipment.seller_id].append(shipment.shipment_id)
+    return shipment_ids.items()
+
+
+def existing_shipments(shipments):
+    """Maps (seller id, shipment id) to the (id, transport id) of the stored shipment."""
+    existing = {}
+    for seller_id, shipment_ids in seller_shipment_ids(shipments):
+        rows = Shipment.objects.filter(seller_id=seller_id, shipment_id__in=shipment_ids).values_list(
+            "shipment_id", "id", "transport_id"
+        )
+        for shipment_id, pk, transport_id in rows:
+            existing[(seller_id, shipment_id)] = (pk, transport_id)
+    return existing
+
+
+def archived_shipments(shipments):
+    archived = set()
+    for seller_id, shipment_ids in seller_shipment_ids(shipments):
+        rows = ArchivedShipment.objects.filter(seller_id=seller_id, shipment_id__in=shipment_ids).values_list(
+            "shipment_id", flat=True
+        )
+        archived.update((seller_id, shipment_id) for shipment_id in rows)
+    return archived
+
+
+def write_shipments(parsed_shipments):
+    """
+    Saves decoded shipments with a handful of bulk statements in one transaction, whatever the batch
+    size. Shipments which were saved before are updated, archived ones are left alone. Returns the
+    saved shipments.
+    """
+    parsed_shipments = list(parsed_shipments)
+    archived = archived_shipments([parsed.shipment for parsed in parsed_shipments])
+    parsed_shipments = [
+        parsed
+        for parsed in parsed_shipments
+        if (parsed.shipment.seller_id, parsed.shipment.shipment_id) not in archived
+    ]
+    if not parsed_shipments:
+        return []
+
+    with transaction.atomic():
+        user_data = [parsed.customer for parsed in parsed_shipments] + [
+            parsed.billing for parsed in parsed_shipments if parsed.billing is not None
+        ]
+        saved_user_data = iter(
+            UserData.objects.bulk_get_or_create([user_data_values(data) for data in user_data])
+        )
+        customers = [next(saved_user_data) for _ in parsed_shipments]
+        billings = [
+            next(saved_user_data) if parsed.billing is not None else None for parsed in parsed_shipments
+        ]
+
+        shipments = [parsed.shipment for parsed in parsed_shipments]
+        existing = existing_shipments(shipments)
+
+        # shipments bol.com sent before keep their transport, it's updated in place.
+        new_transports, changed_transports = [], []
+        for parsed in parsed_shipments:
+            key = (parsed.shipment.seller_id, parsed.shipment.shipment_id)
+            _, transport_pk = existing.get(key, (None, None))
+            parsed.transport.pk = transport_pk
+            (changed_transports if transport_pk else new_transports).append(parsed.transport)
+        Transport.objects.bulk_create(new_transports)
+        if new_transports and not connection.features.can_return_rows_from_bulk_insert:
+            read_back_transports(new_transports)
+        if changed_transports:
+            Transport.objects.bulk_update(changed_transports, TRANSPORT_FIELDS)
+
+        for parsed, customer, billing in zip(parsed_shipments, customers, billings):
+            shipment = parsed.shipment
+            shipment.transport, shipment.customer, shipment.billing = parsed.transport, customer, billing
+        Shipment.objects.upsert(shipments)
+
+        # the upsert can't return ids, their items are replaced as a whole.
+        saved = existing_shipments(shipments)
+        for shipment in shipments:
+            shipment.pk, _ = saved[(shipment.seller_id, shipment.shipment_id)]
+        ShipmentItem.objects.filter(shipment_id__in=[pk for pk, _ in existing.values()]).delete()
+
+        items = []
+        for parsed in parsed_shipments:
+            for item in parsed.items:
+                item.shipment = parsed.shipment
+                items.append(item)
+        ShipmentItem.objects.bulk_create(items)
+
+        for seller_id in {shipment.seller_id for shipment in shipments}:
+            transaction.on_commit(lambda seller_id=seller_id: bump_shipments_version(seller_id))
+
+    return shipments